@@ -0,0 +1,329 @@
+# Benchmark Suite
+
+'''
+Reproducible timings of the NLP and response pipeline, written as JSON so runs can be compared
+Covers message_clean_up, bow, get_probabilities, get_class, get_indexed_response and responses_main on corpus patterns,
+and building training data (documents, vocabulary and matrices) from synthetic corpora scaled up from corpora/*.json
+    warm: repeated calls in this process, after everything is loaded
+    cold: first calls in a fresh process (imports, WordNet, model load), and training data, both with an empty lemma cache
+
+Usage: python benchmark.py --topic general --sizes 10000 100000 --output results.json [--compare baseline.json]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+import numpy
+import corpus_stream
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Timing Functions
+
+def summarise(seconds):
+    '''
+    Per call statistics in milliseconds of a list of call times in seconds
+    '''
+
+    seconds = sorted(seconds)
+    return {
+        'calls': len(seconds),
+        'min_ms': seconds[0] * 1000,
+        'median_ms': seconds[len(seconds) // 2] * 1000,
+        'mean_ms': sum(seconds) / len(seconds) * 1000,
+        'p95_ms': seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))] * 1000
+    }
+
+def time_calls(function, inputs, repeat):
+    '''
+    Calls function with every tuple of arguments in inputs, repeat times over, timing each call
+    '''
+
+    seconds = []
+    for _ in range(repeat):
+        for args in inputs:
+            start_time = time.perf_counter()
+            function(*args)
+            seconds.append(time.perf_counter() - start_time)
+    return summarise(seconds)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Corpus Functions
+
+def load_corpus(topic):
+    with open(f'{current_path}/corpora/{topic}.json', encoding='utf-8') as file:
+        return json.load(file)
+
+def sample_messages(corpus, count, seed):
+    '''
+    Gets a fixed sample of the corpus patterns to use as messages
+    '''
+
+    patterns = [pattern for intent in corpus['intents'] for pattern in intent['patterns']]
+    rng = random.Random(seed)
+    return [rng.choice(patterns) for _ in range(count)]
+
+def synthetic_corpus(pattern_count, seed=0):
+    '''
+    Scales every corpus in corpora/ up to a corpus of pattern_count patterns
+    - keeps every intent (tags prefixed by their corpus) and spreads the patterns over them evenly
+    - each new pattern is an existing pattern of the intent with a word swapped and a word added from the whole vocabulary
+    - new words are invented at a falling rate, so the vocabulary grows with the square root of the corpus size
+      (about VOCABULARY_GROWTH * sqrt(patterns) words) as it does with real text
+    '''
+
+    rng = random.Random(seed)
+    tag_intents = {} # line-delimited corpora can split a tag over several lines
+    for corpus_file in corpus_stream.list_corpora(f'{current_path}/corpora'):
+        topic = os.path.splitext(corpus_file)[0]
+        for intent in corpus_stream.read_intents(f'{current_path}/corpora/{corpus_file}'):
+            patterns, responses = tag_intents.setdefault(f"{topic}_{intent['tag']}", ([], []))
+            patterns.extend(intent.get('patterns', []))
+            if 'responses' in intent:
+                responses[:] = intent['responses']
+    base_intents = [(tag, patterns, responses) for tag, (patterns, responses) in tag_intents.items() if patterns]
+    vocabulary = sorted({word for tag, patterns, responses in base_intents for pattern in patterns for word in pattern.split()})
+
+    intents = [{'tag': tag, 'patterns': [], 'responses': responses} for tag, patterns, responses in base_intents]
+    for i in range(pattern_count):
+        intent = intents[i % len(intents)]
+        words = rng.choice(base_intents[i % len(intents)][1]).split()
+        words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        if rng.random() < VOCABULARY_GROWTH / (2 * (i + 1) ** 0.5):
+            vocabulary.append(f'{rng.choice(vocabulary)}{len(vocabulary)}')
+            words.insert(rng.randrange(len(words) + 1), vocabulary[-1])
+        else:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(vocabulary))
+        intent['patterns'].append(' '.join(words))
+    return {'intents': intents}
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Benchmark Functions
+
+def pipeline_benchmarks(topic, repeat, messages):
+    '''
+    Warm timings of each response pipeline stage for one topic
+    '''
+
+    import responses
+
+    engine = responses.engine_cache.get(topic)
+    for message_text in messages: # first calls load WordNet and build the model's graph
+        responses.responses_main(topic, message_text)
+
+    inputs = [(message_text,) for message_text in messages]
+    results = [(message_text, responses.get_probabilities(message_text, engine.words, engine.model, engine.word_index, engine.tokeniser)) for message_text in messages]
+    class_indices = [responses.get_class_index(list(result)) for message_text, result in results if result]
+    return {
+        'message_clean_up': time_calls(lambda message_text: responses.message_clean_up(message_text, engine.tokeniser), inputs, repeat),
+        'bow': time_calls(lambda message_text: responses.bow(message_text, engine.words), inputs, repeat),
+        'bow_encode': time_calls(lambda message_text: responses.bow_encode(message_text, engine.word_index, engine.tokeniser), inputs, repeat),
+        'get_probabilities': time_calls(lambda message_text: responses.get_probabilities(message_text, engine.words, engine.model, engine.word_index, engine.tokeniser), inputs, repeat),
+        'get_class': time_calls(lambda result: responses.get_class(list(result), engine.word_classes), [(result,) for message_text, result in results if result], repeat),
+        'get_indexed_response': time_calls(lambda class_index: responses.get_indexed_response(class_index, engine.response_table), [(class_index,) for class_index in class_indices], repeat),
+        'responses_main': time_calls(lambda message_text: responses.responses_main(topic, message_text), inputs, repeat)
+    }
+
+def training_data_benchmark(corpus):
+    '''
+    Times each stage of building training data from a corpus, as training.save_data() and create_training_data() do
+    Model fitting is not included
+    '''
+
+    import training
+
+    stage_seconds = {}
+    start_time = time.perf_counter()
+    words, word_classes, docs, tag_responses = training.corpus_documents(corpus)
+    stage_seconds['documents'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    word_set, word_classes_set = training.build_vocabulary(words, word_classes)
+    stage_seconds['vocabulary'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    word_index = {word: i for i, word in enumerate(word_set)}
+    class_index = {word_class: i for i, word_class in enumerate(word_classes_set)}
+    input_train, output_train = training.create_training_matrices(word_index, class_index, docs)
+    stage_seconds['matrices'] = time.perf_counter() - start_time
+
+    report = {f'{stage}_ms': seconds * 1000 for stage, seconds in stage_seconds.items()}
+    report['total_ms'] = sum(stage_seconds.values()) * 1000
+    report.update({'patterns': len(docs), 'words': len(word_set), 'classes': len(word_classes_set), 'matrix_bytes': int(input_train.nbytes + output_train.nbytes)})
+    return report
+
+def training_benchmarks(sizes, seed):
+    '''
+    Cold (empty lemma cache) and warm timings of building training data at each synthetic corpus size
+    '''
+
+    import normalisation
+
+    results = {}
+    for size in sizes:
+        corpus = synthetic_corpus(size, seed)
+        with normalisation.normaliser.lock: # cold run starts without memoised lemmas, and without the saved cache
+            normalisation.normaliser.cache.clear()
+            normalisation.normaliser.loaded = True
+        results[f'training_data_{size}'] = {'cold': training_data_benchmark(corpus), 'warm': training_data_benchmark(corpus)}
+    return results
+
+def cold_start(topic, message_text):
+    '''
+    First call timings in the current process, meant to be run in a fresh one: python benchmark.py --cold-start
+    '''
+
+    timings = {}
+    start_time = time.perf_counter()
+    import responses
+    timings['import_ms'] = (time.perf_counter() - start_time) * 1000
+
+    import normalisation
+    with normalisation.normaliser.lock: # WordNet is timed rather than a lookup in the saved lemma cache
+        normalisation.normaliser.loaded = True
+
+    start_time = time.perf_counter()
+    responses.message_clean_up(message_text)
+    timings['first_clean_up_ms'] = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    responses.engine_cache.get(topic)
+    timings['engine_load_ms'] = (time.perf_counter() - start_time) * 1000
+
+    start_time = time.perf_counter()
+    responses.responses_main(topic, message_text)
+    timings['first_response_ms'] = (time.perf_counter() - start_time) * 1000
+    return timings
+
+def cold_benchmarks(topic, message_text, runs):
+    '''
+    Runs cold_start() in runs fresh processes, returns the median of each timing
+    '''
+
+    command = [sys.executable, os.path.abspath(__file__), '--cold-start', '--topic', topic, '--message', message_text]
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=current_path, env=os.environ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: sorted(sample[key] for sample in samples)[len(samples) // 2] for key in samples[0]}
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Report Functions
+
+def get_metadata(args):
+    '''
+    Environment of the run, so results are only compared like for like
+    '''
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, cwd=current_path).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'platform': platform.platform(),
+        'backend': os.environ.get('KAI_BACKEND', 'keras'),
+        'topic': args.topic,
+        'repeat': args.repeat,
+        'seed': args.seed
+    }
+
+def flatten(results, prefix=''):
+    '''
+    Flattens nested results into {'pipeline.bow.median_ms': value}
+    '''
+
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif key.endswith('_ms'):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+def compare(results, baseline, tolerance, min_difference=0.05):
+    '''
+    Lists the median / total / cold timings that are more than tolerance (a fraction) slower than the baseline
+    - slowdowns under min_difference milliseconds are timer noise on the fastest stages and are ignored
+    '''
+
+    current = flatten(results)
+    previous = flatten(baseline)
+    regressions = []
+    for key, value in current.items():
+        if key.endswith(('median_ms', 'total_ms')) or key.startswith('cold.'):
+            if key in previous and previous[key] > 0 and value > previous[key] * (1 + tolerance) and value - previous[key] > min_difference:
+                regressions.append((key, previous[key], value))
+    return regressions
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def benchmark_main(argv=None):
+    '''
+    Parses the command line arguments, runs the benchmarks and writes the results
+    Exits with status 1 if --compare finds a regression
+    '''
+
+    parser = argparse.ArgumentParser(description='Benchmarks the kAi NLP and response pipeline')
+    parser.add_argument('--topic', default='general')
+    parser.add_argument('--messages', type=int, default=50, help='corpus patterns used as messages')
+    parser.add_argument('--repeat', type=int, default=20, help='times each message is timed in warm runs')
+    parser.add_argument('--sizes', type=int, nargs='*', default=[10000, 100000], help='synthetic corpus sizes in patterns')
+    parser.add_argument('--cold-runs', type=int, default=3, help='fresh processes for cold start timings, 0 to skip')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON results file, printed if not given')
+    parser.add_argument('--compare', help='baseline results file to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--min-difference', type=float, default=0.05, help='smallest slowdown in ms counted as a regression')
+    parser.add_argument('--cold-start', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--message', default='hello', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold_start:
+        print(json.dumps(cold_start(args.topic, args.message)))
+        return
+
+    messages = sample_messages(load_corpus(args.topic), args.messages, args.seed)
+    report = {'metadata': get_metadata(args), 'results': {}}
+    if args.cold_runs:
+        report['results']['cold'] = cold_benchmarks(args.topic, messages[0], args.cold_runs)
+    report['results']['pipeline'] = pipeline_benchmarks(args.topic, args.repeat, messages)
+    report['results']['training'] = training_benchmarks(args.sizes, args.seed)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = compare(report['results'], baseline['results'], args.tolerance, args.min_difference)
+        for key, previous, value in regressions:
+            print(f'regression: {key} {previous:.3f}ms -> {value:.3f}ms', file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+VOCABULARY_GROWTH = 3.0 # synthetic corpora of 10k / 100k patterns have about 300 / 950 more words than corpora/
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    benchmark_main(sys.argv[1:])
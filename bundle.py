@@ -0,0 +1,209 @@
+# Model Bundles
+
+'''
+Single-file, versioned model bundle format - models/{topic}.kai
+Holds the vocabulary, classes, compiled response table and weight tensors of a topic in one file
+Weight tensors are stored in 64 byte aligned sections so they are numpy.memmap-ed zero-copy on load,
+letting several server processes share the same pages, and nothing is unpickled when loading
+
+Layout:
+    8 bytes   magic b'KAIBNDL\0'
+    4 bytes   format version, little endian uint32
+    8 bytes   header length, little endian uint64
+    header    UTF-8 JSON: words, word_classes, response_table, layers and tensor offsets
+              version 2 adds int8 kernels with a per-layer 'scale', written only for models compressed to int8
+    padding   to the next 64 byte boundary, then each tensor section, each padded to 64 bytes
+
+Existing models are converted with: python bundle.py [topic ...]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import pickle
+import struct
+import tempfile
+import numpy
+import numpy_backend
+import normalisation
+import compression
+import response_table
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Bundle Class
+
+class Bundle:
+    '''
+    Contents of a loaded bundle - model is a NumpyModel over the (memory mapped) weight tensors
+    '''
+
+    def __init__(self, words, word_classes, response_table, model, metadata):
+        self.words = words
+        self.word_classes = word_classes
+        self.response_table = response_table
+        self.model = model
+        self.metadata = metadata
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Write + Load Functions
+
+def align(position):
+    '''
+    Rounds a file position up to the next ALIGNMENT boundary
+    '''
+
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def write_bundle(path, words, word_classes, table, layers, metadata=None, scales=None):
+    '''
+    Writes a bundle file
+    - layers is a list of (kernel, bias, activation name) as used by numpy_backend.NumpyModel
+    - kernels keep a float16 or int8 dtype, scales are the per-layer scales of int8 kernels
+    - written to a temporary file then renamed, so processes with the old bundle mapped keep a valid file
+    '''
+
+    tensors = []
+    header_layers = []
+    for i, (kernel, bias, activation) in enumerate(layers):
+        header_layers.append({'kernel': f'kernel_{i}', 'bias': f'bias_{i}', 'activation': activation})
+        if scales and scales[i] is not None:
+            header_layers[-1]['scale'] = scales[i]
+        kernel_dtype = kernel.dtype if kernel.dtype in KERNEL_DTYPES else numpy.float32
+        tensors.append((f'kernel_{i}', numpy.ascontiguousarray(kernel, dtype=kernel_dtype)))
+        tensors.append((f'bias_{i}', numpy.ascontiguousarray(bias, dtype=numpy.float32)))
+
+    header = {
+        'words': words,
+        'word_classes': word_classes,
+        'response_table': table,
+        'layers': header_layers,
+        'metadata': metadata or {},
+        'tensors': {}
+    }
+
+    # tensor offsets depend on the header length, which depends on the offsets, so the header is sized with placeholders first
+    header_length = 0
+    while True:
+        offset = align(PREAMBLE.size + header_length)
+        for name, array in tensors:
+            header['tensors'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset = align(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode('utf-8')
+        if len(header_bytes) == header_length:
+            break
+        header_length = len(header_bytes)
+
+    # a temporary file of its own, so two writers of the same bundle never write or rename the same file
+    fd, temp_path = tempfile.mkstemp(prefix=f'.{os.path.basename(path)}_', suffix='.tmp', dir=os.path.dirname(path) or None)
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION if scales else 1, header_length)) # version 1 readers can read unscaled bundles
+            file.write(header_bytes)
+            for name, array in tensors:
+                file.write(b'\0' * (header['tensors'][name]['offset'] - file.tell()))
+                file.write(array.tobytes())
+            file.write(b'\0' * (align(file.tell()) - file.tell()))
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def read_header(path):
+    '''
+    Reads and validates the preamble and JSON header of a bundle
+    '''
+
+    with open(path, 'rb') as file:
+        magic, version, header_length = PREAMBLE.unpack(file.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a kAi model bundle')
+        if version > FORMAT_VERSION:
+            raise ValueError(f'{path} is bundle version {version}, this kAi reads up to version {FORMAT_VERSION}')
+        return json.loads(file.read(header_length).decode('utf-8'))
+
+def load_bundle(path, memory_map=True):
+    '''
+    Loads a bundle, memory mapping the weight tensors read-only unless memory_map is False
+    '''
+
+    header = read_header(path)
+    arrays = {}
+    for name, tensor in header['tensors'].items():
+        shape = tuple(tensor['shape'])
+        if memory_map:
+            arrays[name] = numpy.memmap(path, dtype=tensor['dtype'], mode='r', offset=tensor['offset'], shape=shape)
+        else:
+            with open(path, 'rb') as file:
+                file.seek(tensor['offset'])
+                count = int(numpy.prod(shape))
+                arrays[name] = numpy.fromfile(file, dtype=tensor['dtype'], count=count).reshape(shape)
+
+    layers = [(arrays[layer['kernel']], arrays[layer['bias']], layer['activation']) for layer in header['layers']]
+    scales = [layer.get('scale') for layer in header['layers']]
+    model = numpy_backend.NumpyModel(layers, scales if any(scale is not None for scale in scales) else None)
+    return Bundle(header['words'], header['word_classes'], header['response_table'], model, header['metadata'])
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Converter Functions
+
+def convert_model(model_name, tokeniser=None, precision='float32', sparsity=0.0):
+    '''
+    Converts the separate artifacts of a trained topic in models/ into models/{model_name}.kai
+    - exports the numpy weights from the .h5 model first if they do not exist yet
+    - records the tokeniser the topic was trained with, from its words file if not given
+    - precision and sparsity compress the weights, see compression.py
+    '''
+
+    models_path = f'{current_path}/models'
+    if not os.path.exists(f'{models_path}/{model_name}_weights.npz'):
+        numpy_backend.export_weights(model_name)
+    words, words_tokeniser = normalisation.load_words(f'{models_path}/{model_name}_words.pkl', model_name)
+    with open(f'{models_path}/{model_name}_classes.pkl', 'rb') as file:
+        word_classes = pickle.load(file)
+
+    if os.path.exists(f'{models_path}/{model_name}_responses.json'):
+        table = response_table.load_response_table(f'{models_path}/{model_name}_responses.json')
+    else:
+        with open(f'{current_path}/corpora/{model_name}.json', encoding='utf-8') as file:
+            table = response_table.compile_response_table(response_table.corpus_responses(json.load(file)), word_classes)
+
+    model = numpy_backend.load_numpy_model(f'{models_path}/{model_name}_weights.npz')
+    layers, scales = compression.compress_layers(model.layers, precision, sparsity)
+    write_bundle(f'{models_path}/{model_name}{BUNDLE_SUFFIX}', words, word_classes, table, layers, {
+        'model_name': model_name,
+        'tokeniser': tokeniser or words_tokeniser,
+        'precision': precision,
+        'sparsity': sparsity
+    }, scales)
+
+def bundle_main(model_names):
+    '''
+    Converts the given topics, or every trained topic in models/ if none are given
+    '''
+
+    if not model_names:
+        model_names = [file[:-len('_classes.pkl')] for file in os.listdir(f'{current_path}/models/') if file.endswith('_classes.pkl')]
+    for model_name in model_names:
+        convert_model(model_name)
+        size = os.path.getsize(f'{current_path}/models/{model_name}{BUNDLE_SUFFIX}')
+        print(f'{model_name}: {model_name}{BUNDLE_SUFFIX} written ({size / 1024:.0f} KB)')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+MAGIC = b'KAIBNDL\0'
+FORMAT_VERSION = 2
+PREAMBLE = struct.Struct('<8sIQ') # magic, version, header length
+ALIGNMENT = 64
+BUNDLE_SUFFIX = '.kai'
+KERNEL_DTYPES = [numpy.float32, numpy.float16, numpy.int8]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    bundle_main(sys.argv[1:])
@@ -0,0 +1,196 @@
+# Model Compression
+
+'''
+Post-training compression of the topic models into smaller bundles
+- pruning: removes the hidden units with the smallest weights (their incoming column, bias and outgoing row),
+  so the pruned kernels stay dense and memory mapped rather than needing a sparse format
+- quantisation: stores kernels as float16, or as int8 with one scale per layer
+  (served as described in numpy_backend.NumpyModel, only the first layer stays compressed in memory)
+Compressed models are written as models/{topic}.kai and served by the bundle backend (KAI_BACKEND=bundle),
+the float32 models/{topic}_weights.npz export is kept as the original
+
+Usage:
+    python compression.py --precision int8 --sparsity 0.25 [topic ...]    compresses the topics' bundles
+    python compression.py --report [topic ...]                              accuracy and size of each setting against the original
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import numpy
+import numpy_backend
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Compression Functions
+
+def prune_units(layers, sparsity):
+    '''
+    Magnitude pruning of hidden units, removes the sparsity fraction of units in every hidden layer
+    - a unit is scored by the size of its incoming weights and bias times the size of its outgoing weights
+    - the output layer is never pruned, so the classes are unchanged
+    '''
+
+    if not sparsity:
+        return list(layers)
+    layers = [[numpy.asarray(kernel, dtype=numpy.float32), numpy.asarray(bias, dtype=numpy.float32), activation] for kernel, bias, activation in layers]
+    for i in range(len(layers) - 1):
+        kernel, bias, activation = layers[i]
+        next_kernel = layers[i + 1][0]
+        scores = (numpy.linalg.norm(kernel, axis=0) + numpy.abs(bias)) * numpy.linalg.norm(next_kernel, axis=1)
+        keep_count = max(1, round(len(bias) * (1 - sparsity)))
+        keep = numpy.sort(numpy.argsort(scores)[-keep_count:]) # keeps the surviving units in their original order
+        layers[i] = [kernel[:, keep], bias[keep], activation]
+        layers[i + 1][0] = next_kernel[keep]
+    return [tuple(layer) for layer in layers]
+
+def quantise_kernel(kernel, precision):
+    '''
+    Converts a kernel to the given precision, returns the kernel and its scale (None unless int8)
+    - int8 is symmetric: the largest absolute weight maps to 127
+    '''
+
+    kernel = numpy.asarray(kernel, dtype=numpy.float32)
+    if precision == 'float32':
+        return kernel, None
+    if precision == 'float16':
+        return kernel.astype(numpy.float16), None
+    largest = float(numpy.abs(kernel).max())
+    scale = largest / 127 if largest else 1.0
+    return numpy.clip(numpy.round(kernel / scale), -127, 127).astype(numpy.int8), scale
+
+def compress_layers(layers, precision='float32', sparsity=0.0):
+    '''
+    Prunes then quantises a list of (kernel, bias, activation) layers
+    Returns the compressed layers and the per-layer scales (None if no layer is int8)
+    - biases stay float32, they are a tiny part of the model
+    '''
+
+    if precision not in PRECISIONS:
+        raise ValueError(f'unknown precision {precision!r}, expected one of {PRECISIONS}')
+    compressed = []
+    scales = []
+    for kernel, bias, activation in prune_units(layers, sparsity):
+        kernel, scale = quantise_kernel(kernel, precision)
+        compressed.append((kernel, numpy.asarray(bias, dtype=numpy.float32), activation))
+        scales.append(scale)
+    if precision != 'int8':
+        scales = None
+    return compressed, scales
+
+def weights_size(layers):
+    return sum(kernel.nbytes + bias.nbytes for kernel, bias, activation in layers)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Report Functions
+
+def corpus_examples(model_name):
+    '''
+    Gets every (pattern, tag) of a topic's corpus
+    '''
+
+    with open(f'{current_path}/corpora/{model_name}.json', encoding='utf-8') as file:
+        corpus = json.load(file)
+    return [(pattern, intent['tag']) for intent in corpus['intents'] for pattern in intent['patterns']]
+
+def compression_report(model_name, settings=None):
+    '''
+    Compares each (precision, sparsity) setting against the original float32 model on the topic's corpus patterns
+    - accuracy: predicted tag is the pattern's tag, agreement: same prediction as the original model
+    - max_difference: largest change in any class probability
+    - bundle_bytes: size of the bundle file written with the setting
+    '''
+
+    import bundle
+    import responses
+
+    settings = settings or REPORT_SETTINGS
+    original = numpy_backend.load_numpy_model(f'{current_path}/models/{model_name}_weights.npz')
+    loaded = bundle.load_bundle(f'{current_path}/models/{model_name}{bundle.BUNDLE_SUFFIX}', memory_map=False)
+    examples = corpus_examples(model_name)
+    bags = responses.bow_encode([pattern for pattern, tag in examples], responses.bow_index(loaded.words), loaded.metadata.get('tokeniser', 'nltk'))
+    expected = numpy.array([loaded.word_classes.index(tag) for pattern, tag in examples])
+    original_probabilities = numpy.asarray(original(bags))
+    original_predictions = original_probabilities.argmax(axis=1)
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for precision, sparsity in settings:
+            layers, scales = compress_layers(original.layers, precision, sparsity)
+            path = f'{directory}/{model_name}{bundle.BUNDLE_SUFFIX}'
+            bundle.write_bundle(path, loaded.words, loaded.word_classes, loaded.response_table, layers, dict(loaded.metadata, precision=precision, sparsity=sparsity), scales)
+            probabilities = numpy.asarray(bundle.load_bundle(path).model(bags))
+            predictions = probabilities.argmax(axis=1)
+            rows.append({
+                'topic': model_name,
+                'precision': precision,
+                'sparsity': sparsity,
+                'accuracy': float((predictions == expected).mean()),
+                'agreement': float((predictions == original_predictions).mean()),
+                'max_difference': float(numpy.abs(probabilities - original_probabilities).max()),
+                'weights_bytes': weights_size(layers),
+                'bundle_bytes': os.path.getsize(path)
+            })
+    return rows
+
+def print_report(rows):
+    print(f"{'topic':<12} {'precision':<9} {'sparsity':>8} {'accuracy':>9} {'agreement':>9} {'max diff':>9} {'weights KB':>10} {'bundle KB':>10}")
+    for row in rows:
+        print(f"{row['topic']:<12} {row['precision']:<9} {row['sparsity']:>8.0%} {row['accuracy']:>9.2%} {row['agreement']:>9.2%} {row['max_difference']:>9.4f} {row['weights_bytes'] / 1024:>10.1f} {row['bundle_bytes'] / 1024:>10.1f}")
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def compression_main(argv=None):
+    '''
+    Compresses the bundles of the given topics, or reports on every setting with --report
+    Topics default to every exported model in models/
+    '''
+
+    parser = argparse.ArgumentParser(description='Prune and quantise the kAi topic model bundles')
+    parser.add_argument('topics', nargs='*')
+    parser.add_argument('--precision', choices=PRECISIONS, default='int8')
+    parser.add_argument('--sparsity', type=float, default=0.0, help='fraction of hidden units pruned per layer')
+    parser.add_argument('--report', action='store_true', help='compare every setting against the original model instead')
+    parser.add_argument('--output', help='JSON file for the report rows')
+    args = parser.parse_args(argv)
+
+    import bundle
+
+    topics = args.topics or [file[:-len('_weights.npz')] for file in sorted(os.listdir(f'{current_path}/models/')) if file.endswith('_weights.npz')]
+    if not args.report:
+        for model_name in topics:
+            bundle.convert_model(model_name, precision=args.precision, sparsity=args.sparsity)
+            size = os.path.getsize(f'{current_path}/models/{model_name}{bundle.BUNDLE_SUFFIX}')
+            print(f'{model_name}: {args.precision}, {args.sparsity:.0%} pruned, {model_name}{bundle.BUNDLE_SUFFIX} written ({size / 1024:.0f} KB)')
+        return
+
+    rows = []
+    for model_name in topics:
+        if os.path.exists(f'{current_path}/corpora/{model_name}.json'): # the unified model has no corpus of its own
+            rows.extend(compression_report(model_name))
+    print_report(rows)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(rows, file, indent=4)
+    return rows
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+PRECISIONS = ['float32', 'float16', 'int8']
+REPORT_SETTINGS = [
+    ('float32', 0.0), ('float16', 0.0), ('int8', 0.0),
+    ('float32', 0.25), ('int8', 0.25), ('int8', 0.5), ('int8', 0.75)
+]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    compression_main(sys.argv[1:])
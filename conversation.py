@@ -0,0 +1,170 @@
+# Conversation Store
+
+'''
+Bounded, persistent message thread for the chat window
+Entries are the chat window thread entries: [0 = user / 1 = AI, message lines, time] or [2, topic string, time]
+
+On disk a conversation is two append-only files:
+    {path}.jsonl   one JSON entry per line
+    {path}.idx     byte offset of every entry in the .jsonl, little endian uint64
+Only the most recent entries are kept in memory, older entries are paged in from disk when scrolled back to,
+and reopening a conversation reads just its last window of entries through the index instead of the whole log
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import json
+import struct
+from collections import OrderedDict, deque
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Conversation Store Class
+
+class ConversationStore:
+    '''
+    Message thread with a fixed size in-memory window over an append-only log
+    - window: most recent entries kept in memory, restored from disk on open
+    - page_size, max_pages: older entries are read from disk a page at a time, keeping max_pages pages
+    Entries read from memory or the page cache are the same objects each time, so the BubbleCache keeps their renders
+    '''
+
+    def __init__(self, path, window=200, page_size=64, max_pages=4):
+        self.log_path = f'{path}.jsonl'
+        self.index_path = f'{path}.idx'
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.recent = deque(maxlen=window)
+        self.pages = OrderedDict() # page number -> entries
+        self.count = 0
+
+        directory = os.path.dirname(self.log_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.recover()
+        self.restore()
+        self.log_file = open(self.log_path, 'ab')
+        self.index_file = open(self.index_path, 'ab')
+
+    def __len__(self):
+        return self.count
+
+    def recover(self):
+        '''
+        Makes the log and index consistent after an interrupted write
+        - drops a partly written last line from the log and index entries past the end of the log
+        - indexes complete lines written to the log after the last indexed entry
+        Only reads the tail of the log past the last indexed entry
+        '''
+
+        for path in (self.log_path, self.index_path):
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+
+        log_size = os.path.getsize(self.log_path)
+        count = os.path.getsize(self.index_path) // OFFSET.size
+        while count and self.read_offset(count - 1) >= log_size:
+            count -= 1
+
+        # the last indexed entry is re-read as it may be the partly written line
+        tail_start = self.read_offset(count - 1) if count else 0
+        count = max(count - 1, 0)
+        with open(self.log_path, 'rb') as file:
+            file.seek(tail_start)
+            tail = file.read()
+        offsets = []
+        position = tail_start
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                break
+            offsets.append(position)
+            position += len(line)
+
+        with open(self.log_path, 'r+b') as file:
+            file.truncate(position)
+        with open(self.index_path, 'r+b') as file:
+            file.truncate(count * OFFSET.size)
+            file.seek(0, os.SEEK_END)
+            file.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+        self.count = count + len(offsets)
+
+    def restore(self):
+        '''
+        Loads the last window of entries into memory
+        '''
+
+        start = max(0, self.count - self.recent.maxlen)
+        self.recent.extend(self.read_entries(start, self.count))
+
+    def read_offset(self, index):
+        with open(self.index_path, 'rb') as file:
+            file.seek(index * OFFSET.size)
+            return OFFSET.unpack(file.read(OFFSET.size))[0]
+
+    def read_entries(self, start, stop):
+        '''
+        Reads entries start to stop (exclusive) from the log, with one seek and read
+        '''
+
+        if start >= stop:
+            return []
+        with open(self.log_path, 'rb') as file:
+            file.seek(self.read_offset(start))
+            if stop < self.count:
+                data = file.read(self.read_offset(stop) - file.tell())
+            else:
+                data = file.read()
+        return [json.loads(line) for line in data.splitlines()]
+
+    def append(self, entry):
+        '''
+        Adds an entry to the end of the conversation, writing it through to disk
+        '''
+
+        self.index_file.write(OFFSET.pack(self.log_file.tell()))
+        self.log_file.write((json.dumps(entry) + '\n').encode('utf-8'))
+        self.log_file.flush()
+        self.index_file.flush()
+        self.recent.append(entry)
+        self.count += 1
+
+    def get(self, index):
+        '''
+        Gets entry index (0 = oldest), from memory if it is recent, otherwise from its page on disk
+        '''
+
+        recent_start = self.count - len(self.recent)
+        if index >= recent_start:
+            return self.recent[index - recent_start]
+
+        page_number = index // self.page_size
+        page = self.pages.get(page_number)
+        if page is None:
+            page_start = page_number * self.page_size
+            page = self.read_entries(page_start, min(page_start + self.page_size, self.count))
+            if len(page) < self.page_size: # the last page is still growing, appends would make a cached copy stale
+                return page[index - page_start]
+            self.pages[page_number] = page
+            if len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+        self.pages.move_to_end(page_number)
+        return page[index - page_number * self.page_size]
+
+    def newest_first(self, skip=0):
+        '''
+        Iterates from the newest entry to the oldest, after skipping the newest skip entries (scrolled back)
+        Lazy, so drawing only reads as far back as fits on screen
+        '''
+
+        for index in range(self.count - 1 - skip, -1, -1):
+            yield self.get(index)
+
+    def close(self):
+        self.log_file.close()
+        self.index_file.close()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+OFFSET = struct.Struct('<Q')
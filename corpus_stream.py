@@ -0,0 +1,162 @@
+# Streaming Corpora
+
+'''
+Readers for the corpus formats in corpora/, as generators so a corpus never has to fit in memory
+- {topic}.json    the original format, one JSON document {"intents": [...]}, read whole
+- {topic}.jsonl   one intent per line: {"tag": ..., "patterns": [...], "responses": [...]}
+- {topic}/        a directory of .jsonl shards, read in name order
+In the line-delimited formats a tag can appear on any number of lines and in any shard, its patterns are combined,
+"responses" can be left out of all but one of its lines (the last given is used, as for repeated tags in .json)
+
+A .json corpus is split into shards with: python corpus_stream.py corpora/topic.json corpora/topic [--shard-lines N]
+(move the .json out of corpora/ afterwards, or both become the same topic)
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import argparse
+from itertools import islice
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Reader Functions
+
+def list_corpora(directory):
+    '''
+    Gets the name of every corpus in a directory - .json and .jsonl files and directories of .jsonl shards
+    '''
+
+    names = []
+    for name in sorted(os.listdir(directory)):
+        path = f'{directory}/{name}'
+        if os.path.isdir(path):
+            if any(file.endswith('.jsonl') for file in os.listdir(path)):
+                names.append(name)
+        elif name.endswith(('.json', '.jsonl')):
+            names.append(name)
+    return names
+
+def is_streamed(path):
+    return os.path.isdir(path) or path.endswith('.jsonl')
+
+def corpus_paths(path):
+    '''
+    Gets the files of a corpus, its shards in name order if it is a directory
+    '''
+
+    if os.path.isdir(path):
+        return [f'{path}/{file}' for file in sorted(os.listdir(path)) if file.endswith('.jsonl')]
+    return [path]
+
+def read_intents(path):
+    '''
+    Generator of the intents of a corpus, one line at a time for the line-delimited formats
+    '''
+
+    if not is_streamed(path):
+        with open(path, encoding='utf-8') as file:
+            yield from json.load(file)['intents']
+        return
+    for shard_path in corpus_paths(path):
+        with open(shard_path, encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    raise ValueError(f'{shard_path} line {line_number}: {error}') from None
+
+def read_patterns(path):
+    '''
+    Generator of (pattern, tag) for every pattern of a corpus
+    '''
+
+    for intent in read_intents(path):
+        for pattern in intent.get('patterns', []):
+            yield pattern, intent['tag']
+
+def load_corpus(path):
+    '''
+    Reads a corpus of any format into the {"intents": [...]} dictionary of the .json format, all in memory
+    '''
+
+    return {'intents': list(read_intents(path))}
+
+def chunked(iterable, size):
+    '''
+    Generator of lists of up to size items from an iterable
+    '''
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Writer Functions
+
+def intent_lines(intents, line_patterns):
+    '''
+    Generator of the JSONL lines of a list of intents, splitting intents into lines of up to line_patterns patterns
+    - responses are only written on the first line of each intent
+    '''
+
+    for intent in intents:
+        patterns = intent.get('patterns', [])
+        for start in range(0, max(len(patterns), 1), line_patterns):
+            line = {'tag': intent['tag'], 'patterns': patterns[start:start + line_patterns]}
+            if start == 0 and 'responses' in intent:
+                line['responses'] = intent['responses']
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+
+def write_shards(intents, directory, shard_lines=None, line_patterns=None):
+    '''
+    Writes intents as a directory of .jsonl shards of up to shard_lines lines each
+    Returns the number of shards written
+    '''
+
+    shard_lines = shard_lines or SHARD_LINES
+    line_patterns = line_patterns or LINE_PATTERNS
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(os.path.normpath(directory))
+    shard_count = 0
+    for shard_count, lines in enumerate(chunked(intent_lines(intents, line_patterns), shard_lines), 1):
+        with open(f'{directory}/{name}-{shard_count - 1:05d}.jsonl', 'w', encoding='utf-8') as file:
+            file.writelines(lines)
+    return shard_count
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def corpus_stream_main(argv=None):
+    '''
+    Splits a corpus into a directory of .jsonl shards
+    '''
+
+    parser = argparse.ArgumentParser(description='Split a kAi corpus into line-delimited shards')
+    parser.add_argument('corpus', help='.json or .jsonl corpus, or a directory of shards')
+    parser.add_argument('directory', help='directory the shards are written to')
+    parser.add_argument('--shard-lines', type=int, default=SHARD_LINES, help='lines per shard')
+    parser.add_argument('--line-patterns', type=int, default=LINE_PATTERNS, help='patterns per line')
+    args = parser.parse_args(argv)
+
+    shard_count = write_shards(read_intents(args.corpus), args.directory, args.shard_lines, args.line_patterns)
+    print(f'{args.corpus}: {shard_count} shards written to {args.directory}')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+SHARD_LINES = 100000
+LINE_PATTERNS = 1000
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    corpus_stream_main(sys.argv[1:])
@@ -14,13 +14,30 @@ Imports AI responses from responses.py, which is trained using training.py
 
 import os
 import sys
-import pygame
 import datetime
 import time
-import win32api
-import win32con
-import win32gui
-import responses
+import timing
+from telemetry import telemetry
+
+# heavy imports are timed for the startup report, nltk + keras are deferred by responses until the first message
+STARTUP_TIMER = timing.StartupTimer()
+with STARTUP_TIMER.measure('import', 'pygame'):
+    import pygame
+
+# headless runs (SDL dummy video driver, e.g. replay.py) have no window to make transparent, so skip win32
+HEADLESS = os.environ.get('KAI_HEADLESS') == '1' or os.environ.get('SDL_VIDEODRIVER') == 'dummy'
+if HEADLESS:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+else:
+    with STARTUP_TIMER.measure('import', 'win32api, win32con, win32gui'):
+        import win32api
+        import win32con
+        import win32gui
+with STARTUP_TIMER.measure('import', 'responses'):
+    import responses
+import slides
+import conversation
 
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -36,6 +53,28 @@ def draw_rect_transparent(surface, colour, rect, radius):
     pygame.draw.rect(shape_surf, colour, shape_surf.get_rect(), border_radius=radius) # draws rectangle using surface
     surface.blit(shape_surf, rect)
 
+def build_static_layer(background, position):
+    '''
+    Pre-composites the unchanging chrome of a screen once into a single display format surface
+        - transparent colour key fill then the background image
+        - the click boxes were drawn with alpha 0, which changes no pixels, so they are not drawn at all
+        - each frame then starts with one blit of this layer instead of a fill, a background blit and a Surface per box
+    '''
+
+    layer = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+    layer.fill(TRANSPARENT)
+    layer.blit(background, position)
+    return layer
+
+def get_static_layer(name, background, position):
+    '''
+    Returns the static layer for a screen, building it the first time the screen is shown
+    '''
+
+    if name not in STATIC_LAYERS:
+        STATIC_LAYERS[name] = build_static_layer(background, position)
+    return STATIC_LAYERS[name]
+
 def draw_centred_text(text, font, color, surface, x, y):
     '''
     Outputs text at the specified location, with (x,y) being the centre of the text object, using the required parameters
@@ -57,6 +96,39 @@ def draw_lefted_text(text, font, color, surface, x, y):
     text_rect.centery = y
     surface.blit(text_obj, text_rect)
 
+def draw_telemetry_overlay(loop_name):
+    '''
+    Draws the frame and response stage timings over the screen, when telemetry and its overlay are enabled
+    '''
+
+    if not (telemetry.enabled and TELEMETRY_OVERLAY):
+        return
+    names = [f'{loop_name}.frame', f'{loop_name}.work', f'{loop_name}.lag'] + RESPONSE_STAGES
+    lines = telemetry.overlay_lines(names)
+    overlay = pygame.Surface((300, 16 * len(lines) + 8), pygame.SRCALPHA)
+    overlay.fill((0, 0, 0, 170))
+    for i, line in enumerate(lines):
+        draw_lefted_text(line, FONT_CB_14, (0, 184, 252), overlay, 6, 12 + 16 * i)
+    SCREEN.blit(overlay, (970, 40))
+
+def tick_frame(loop_name):
+    '''
+    Waits for the next frame (FPS), recording the frame time and loop lag when telemetry is enabled
+        - frame: ms since the previous frame, work: ms of that spent before waiting, lag: ms over the frame budget
+        - FRAME_HOOK, if set, is called with the loop name once per frame, replay.py uses it to drive the loops
+    '''
+
+    frame_ms = CLOCK.tick(FPS)
+    if FRAME_HOOK is not None:
+        FRAME_HOOK(loop_name)
+    if telemetry.enabled:
+        lag_ms = max(0.0, frame_ms - FRAME_BUDGET_MS)
+        telemetry.record(f'{loop_name}.frame', frame_ms)
+        telemetry.record(f'{loop_name}.work', CLOCK.get_rawtime())
+        telemetry.record(f'{loop_name}.lag', lag_ms)
+        if lag_ms >= 1:
+            telemetry.count(f'{loop_name}.missed_frames')
+
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -104,80 +176,249 @@ def box_hover(surface, button, selected_button, hover):
         pygame.draw.rect(surface, (0, 184, 252), button, 4, border_radius=6)
     pygame.draw.rect(surface, (0, 184, 252), selected_button, 4, border_radius=6)
 
+def get_conversation():
+    '''
+    Opens the saved conversation on first use, the same store is kept for every visit to the chat window
+    '''
+
+    global CONVERSATION
+    if CONVERSATION is None:
+        CONVERSATION = conversation.ConversationStore(CONVERSATION_PATH, window=CONVERSATION_WINDOW)
+    return CONVERSATION
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Message Functions
 
+class TextWidths:
+    '''
+    Per-font cache of measured word widths
+    - every word is measured with font.size once, after that wrapping a line is mostly additions
+    - font.size rounds each string to whole pixels, so a sum of widths can be a pixel out per string summed
+    '''
+
+    def __init__(self, font, max_words=10000):
+        self.font = font
+        self.max_words = max_words
+        self.words = {}
+
+    def word(self, word):
+        width = self.words.get(word)
+        if width is None:
+            if len(self.words) >= self.max_words: # long sessions of pasted text should not grow the cache forever
+                self.words.clear()
+            width = self.font.size(word)[0]
+            self.words[word] = width
+        return width
+
+    def break_word(self, word, start, limit, guess=0):
+        '''
+        End of the longest piece of the word from start that is narrower than limit (at least one character)
+        - guess is the length of the previous piece, pieces of repeated text are usually the same length so it is tried first
+        - otherwise found by binary search
+        '''
+
+        low = start + 1
+        high = min(len(word), start + limit) # every character is at least a pixel wide, so long pasted words are not measured whole
+        if guess:
+            end = max(low, min(start + guess, high))
+            if self.font.size(word[start:end])[0] < limit:
+                if end == high or self.font.size(word[start:end + 1])[0] >= limit:
+                    return end
+                low = end + 1
+            else:
+                high = end - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.font.size(word[start:middle])[0] < limit:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+def get_text_widths(font):
+    '''
+    Gets the width cache of a font, creating it on first use
+    '''
+
+    widths = TEXT_WIDTHS.get(font)
+    if widths is None:
+        widths = TextWidths(font)
+        TEXT_WIDTHS[font] = widths
+    return widths
+
 def message_split(font, message, max_length):
     '''
     Splits the user input message into message lines that can be displayed in one message block
         - prevents messages covering the whole screen, and allows for paragraphing
+        - one pass over the words using cached widths, words wider than a line are broken with a binary search
     '''
 
-    tokenised_message = message.split(' ')
+    widths = get_text_widths(font)
+    line_limit = max_length - 5
+    space_width = widths.word(' ')
     messages = []
     text = ''
-    for i in tokenised_message:
-        # if the input has word longer than the message width, split it
-        if font.size(i)[0] > (max_length - 5):
-            for chr in i:
-                if font.size(text)[0] > (max_length - 5):
-                    messages.append(text)
-                    text = ''
-                else:
-                    text += chr
-        
+    text_width = 0
+    width_error = 0 # pixels text_width can be out by, one per summed width
+    for i in message.split(' '):
+        word_width = widths.word(i)
+
+        # if the input has word longer than the message width, split it over as many lines as needed
+        if word_width >= line_limit:
+            if text:
+                messages.append(text)
+            start = 0
+            guess = 0
+            while True:
+                end = widths.break_word(i, start, line_limit, guess)
+                if end == len(i):
+                    break
+                messages.append(i[start:end])
+                guess = end - start
+                start = end
+            text = i[start:] + ' '
+            text_width = widths.word(text)
+            width_error = 0
+            continue
+
+        # checks if message line is within maximum message bubble width size, measuring it whole when too close to call
+        line_width = text_width + word_width + space_width
+        width_error += 2
+        if abs(line_width - line_limit) <= width_error:
+            line_width = font.size(text + i + ' ')[0]
+            width_error = 0
+        if line_width < line_limit:
+            text += i + ' '
+            text_width = line_width
         else:
-            # checks if message line is within maximum message bubble width size
-            if font.size(text + i + ' ')[0] < (max_length - 5):
-                text += i + ' '
-            else:
+            if text:
                 messages.append(text)
-                text = i + ' '
+            text = i + ' '
+            text_width = word_width + space_width
+            width_error = 2
     messages.append(text.rstrip()) # removing last space
     return messages
 
-def draw_messages(thread, font, font_size, time_font, topic_font, screen):
+def render_message(message, font, font_size, time_font, topic_font):
+    '''
+    Rasterises one message thread entry once, so drawing it is only blits
+    - user and AI messages become a bubble surface (with its text lines) and a timestamp surface
+    - topic changes become a single text surface
+    Returns a dictionary of the surfaces and their positions relative to the bottom of the entry
+    '''
+
+    if message[0] == 2:
+        text_surface = topic_font.render(message[1], 1, (0, 184, 252))
+        return {'type': 2, 'text': text_surface, 'text_height': topic_font.size(message[1])[1], 'height': 50}
+
+    bubble_height = bubble_height_of(message, font_size)
+    bubble_width = 0
+
+    # assigning bubble width based on message line lengths
+    for line in message[1]:
+        if font.size(line)[0] > bubble_width:
+            bubble_width = font.size(line)[0] + 20
+
+    # setting user messages to right, ai responses to the left
+    if message[0] == 1:
+        x = 258
+        time_x = x + bubble_width + 10
+    else:
+        x = 1204 - bubble_width
+        time_x = x - 40
+
+    # bubble and its text lines, drawn at the same positions as on screen but relative to the bubble
+    bubble_surface = pygame.Surface((bubble_width, bubble_height), pygame.SRCALPHA)
+    pygame.draw.rect(bubble_surface, (38, 38, 38), bubble_surface.get_rect(), border_radius=15)
+    for j, line in enumerate(reversed(message[1])):
+        draw_lefted_text(line, font, (255, 255, 255), bubble_surface, 10, bubble_height - (j + 1) * (bubble_height / (len(message[1]) + 1)))
+
+    time_surface = time_font.render(message[2], 1, (217, 217, 217))
+    return {
+        'type': message[0],
+        'bubble': bubble_surface,
+        'x': x,
+        'time': time_surface,
+        'time_x': time_x,
+        'height': bubble_height
+    }
+
+def bubble_height_of(message, font_size):
+    '''
+    Height of a user or AI message's bubble, known without rendering it
+    '''
+
+    return int((len(message[1]) + 1) * (font_size))
+
+class BubbleCache:
+    '''
+    Cache of rendered message thread entries, keyed by the entry itself
+    - an entry is rendered the first time it is drawn, after that every frame is a column of blits
+    - entries that were not drawn in the last frame (scrolled fully out of view) are evicted
+    '''
+
+    def __init__(self):
+        self.rendered = {} # id(message) -> (message, render_message() result)
+        self.drawn = set()
+
+    def get(self, message, font, font_size, time_font, topic_font):
+        key = id(message)
+        cached = self.rendered.get(key)
+        if cached is None or cached[0] is not message: # ids can be reused once an entry is gone
+            cached = (message, render_message(message, font, font_size, time_font, topic_font))
+            self.rendered[key] = cached
+        self.drawn.add(key)
+        return cached[1]
+
+    def evict(self):
+        '''
+        Drops everything not drawn since the last call, called once per frame after drawing
+        '''
+
+        for key in list(self.rendered):
+            if key not in self.drawn:
+                del self.rendered[key]
+        self.drawn = set()
+
+def draw_messages(thread, font, font_size, time_font, topic_font, screen, cache=None):
     '''
     Draws most recent messages that fit in the window
         - draws bubbles of an appropriate size for each message
         - spaces the bubbles accordingly
         - outputs time of message next to bubble
         - draws indicator of topic change
+        - messages are pre-rendered once by the BubbleCache, so each frame only blits them
+        - an entry's position is worked out before it is rendered, drawing stops at the first entry that does not fit,
+          so entries scrolled out of view are never rendered (or read from the conversation store)
     '''
 
+    if cache is None:
+        cache = BubbleCache()
     y = 590 # bottom of lowest possible bubble
     for i in thread:
         if i[0] == 2:
-            if (y - topic_font.size(i[1])[1]) > 70:
-                draw_centred_text(i[1], topic_font, (0, 184, 252), screen, 731, y - 20)
-            y -= 50
+            if (y - topic_font.size(i[1])[1]) <= 70:
+                break
+            rendered = cache.get(i, font, font_size, time_font, topic_font)
+            text_rect = rendered['text'].get_rect()
+            text_rect.center = (731, y - 20)
+            screen.blit(rendered['text'], text_rect)
+            y -= rendered['height']
         else:
-            bubble_height = int((len(i[1]) + 1) * (font_size))
-            bubble_width = 0
+            bubble_height = bubble_height_of(i, font_size)
 
-            # assigning bubble width based on message line lengths
-            for line in i[1]:
-                if font.size(line)[0] > bubble_width:
-                    bubble_width = font.size(line)[0] + 20
-            
-            # setting user messages to right, ai responses to the left
-            if i[0] == 1:
-                x = 258
-                time_x = x + bubble_width + 10
-            else:
-                x = 1204 - bubble_width
-                time_x = x - 40
-            
             # outputting text and if within most recent messages
             if (y - bubble_height) > 70:
-                bubble = pygame.Rect(x, y - bubble_height, bubble_width, bubble_height)
-                pygame.draw.rect(screen, (38, 38, 38), bubble, border_radius=15)
-                for j, line in enumerate(reversed(i[1])):
-                    draw_lefted_text(line, font, (255, 255, 255), screen, bubble.left + 10, y - (j + 1) * (bubble_height / (len(i[1]) + 1)))
-                draw_lefted_text(i[2], time_font, (217, 217, 217), screen, time_x, bubble.centery)
+                rendered = cache.get(i, font, font_size, time_font, topic_font)
+                screen.blit(rendered['bubble'], (rendered['x'], y - bubble_height))
+                time_rect = rendered['time'].get_rect()
+                time_rect.left = rendered['time_x']
+                time_rect.centery = y - bubble_height + bubble_height // 2
+                screen.blit(rendered['time'], time_rect)
                 y -= (bubble_height + 10)
             else:
-                return
+                break
+    cache.evict()
 
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -194,7 +435,11 @@ def chat_window(notif_s, notif_r):
     # booleans, lists and text
     message_lines_list = []
     responses_lines_list = []
-    message_thread = []
+    message_thread = get_conversation() # previous conversation is restored, older messages are paged in when scrolled to
+    scroll = 0 # entries scrolled back from the newest
+    pending_replies = [] # (request id, send time) of messages awaiting a reply, in send order
+    finished_replies = {} # request id -> reply computed by the worker, not yet displayed
+    bubble_cache = BubbleCache()
     click = False
     hover = False
     typing_active = False
@@ -222,10 +467,17 @@ def chat_window(notif_s, notif_r):
     topic_strs = ['General Chat', 'Anime', 'Kpop', 'Films', 'Games', 'Football', 'Your life', 'Your day', 'School']
     corpus_topics = ['general', 'anime', 'kpop', 'films', 'games', 'football', 'life', 'day', 'school']
     selected_topic_index = 0
+    for entry in reversed(message_thread.recent): # carrying on in the topic the restored conversation was in
+        if entry[0] == 2:
+            selected_topic_index = topic_strs.index(entry[1])
+            break
 
     # message box
     message_box = pygame.Rect(275, 625, 875, 50)
 
+    # background composited once
+    cw_layer = get_static_layer('chat_window', CW_BG_IMAGE, (0, 0))
+
     while True:
         mx, my = pygame.mouse.get_pos()
         hover = False
@@ -234,49 +486,46 @@ def chat_window(notif_s, notif_r):
         # ---------------------------------------------------------------------------------------------------------------------
         # Drawing Items
 
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), home_icon, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), quit_icon, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), send_icon, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), message_box, 0)
+        # static chrome is in cw_layer, only hover outlines, input text and messages are drawn per frame
         for button in topic_buttons:
-            draw_rect_transparent(SCREEN, (0, 0, 0, 0), button, 4)
             if button.collidepoint(mx, my):
                 hover = True
                 hover_button = button
         box_hover(SCREEN, hover_button, topic_buttons[selected_topic_index], hover)
         draw_lefted_text(text, FONT_CB_20, (255, 255, 255), SCREEN, message_box.left, message_box.centery)
         draw_lefted_text(pretext, FONT_CI_20, (133, 133, 133), SCREEN, message_box.left, message_box.centery)
-        draw_messages(reversed(message_thread), FONT_CB_MESSAGE, CWMESSAGE_SIZE, FONT_CB_14, FONT_CBI_TOPIC,SCREEN)
+        draw_messages(message_thread.newest_first(scroll), FONT_CB_MESSAGE, CWMESSAGE_SIZE, FONT_CB_14, FONT_CBI_TOPIC, SCREEN, bubble_cache)
 
         # text input limit display
         if message_limit:
             draw_lefted_text('Message length limit reached!', FONT_CB_14, (0, 184, 252), SCREEN, message_box.left, message_box.bottom + 8)
 
         # ---------------------------------------------------------------------------------------------------------------------
-        # Getting AI response
-
-        if message_thread:
-            if message_thread[-1][0] == 0:
-                # time delay between notifs
-                loop = True
-                start_time = time.time()
-                while loop:
-                    end_time = time.time()
-                    if (end_time - start_time) > 0.3:
-                        loop = False
-                
-                # getting ai response to add to thread
-                param_text = ' '.join(i for i in message_thread[-1][1])
-                ai_response = responses.responses_main(corpus_topics[selected_topic_index], param_text)
-                if type(ai_response) == list:
-                    for i in ai_response:
-                        responses_lines_list = message_split(FONT_CB_20, i, MAX_BUBBLE_LENGTH)
-                        message_thread.append([1, responses_lines_list, get_time()])
-                else:
-                    responses_lines_list = message_split(FONT_CB_20, ai_response, MAX_BUBBLE_LENGTH)
-                    message_thread.append([1, responses_lines_list, get_time()])            
-                if notif_r:
-                    pygame.mixer.Sound.play(MESSAGE_R_NOTIF)
+        # Getting AI responses
+
+        # replies are computed on the background worker, the frame loop only collects finished ones
+        for request_id, ai_response, error in responses.response_worker.poll():
+            if error:
+                raise error
+            finished_replies[request_id] = ai_response
+
+        # delivering replies in send order, each after a short delay between notifs
+        while pending_replies and pending_replies[0][0] in finished_replies and (time.time() - pending_replies[0][1]) > REPLY_DELAY:
+            request_id, send_time = pending_replies.pop(0)
+            ai_response = finished_replies.pop(request_id)
+            if type(ai_response) == list:
+                for i in ai_response:
+                    responses_lines_list = message_split(FONT_CB_20, i, MAX_BUBBLE_LENGTH)
+                    message_thread.append([1, responses_lines_list, get_time()])
+            else:
+                responses_lines_list = message_split(FONT_CB_20, ai_response, MAX_BUBBLE_LENGTH)
+                message_thread.append([1, responses_lines_list, get_time()])
+            if notif_r:
+                pygame.mixer.Sound.play(MESSAGE_R_NOTIF)
+
+        # typing indicator while a reply is pending
+        if pending_replies and SHOW_TYPING_INDICATOR:
+            draw_lefted_text('kAi is typing...', FONT_CB_14, (133, 133, 133), SCREEN, message_box.left, message_box.top - 10)
 
         # ---------------------------------------------------------------------------------------------------------------------
         # Event Loop
@@ -286,6 +535,11 @@ def chat_window(notif_s, notif_r):
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     click = True
+                    mx, my = event.pos # where the button was pressed
+
+            # scrolling back through the conversation
+            if event.type == pygame.MOUSEWHEEL:
+                scroll = min(max(scroll + event.y, 0), max(len(message_thread) - 1, 0))
             
             # user message input
             if typing_active:
@@ -297,6 +551,9 @@ def chat_window(notif_s, notif_r):
                         if text: # checking if there is a message to send
                             message_lines_list = message_split(FONT_CB_20, text, MAX_BUBBLE_LENGTH)
                             message_thread.append([0, message_lines_list, get_time()]) # 0 = user message and 1 = AI message, adds time of message
+                            scroll = 0 # back to the newest messages
+                            request_id = responses.response_worker.submit(corpus_topics[selected_topic_index], text)
+                            pending_replies.append((request_id, time.time()))
                             if notif_s:
                                 pygame.mixer.Sound.play(MESSAGE_S_NOTIF)
                             text = ''
@@ -334,6 +591,9 @@ def chat_window(notif_s, notif_r):
                 if text:
                     message_lines_list = message_split(FONT_CB_20, text, MAX_BUBBLE_LENGTH)
                     message_thread.append([0, message_lines_list, get_time()])
+                    scroll = 0
+                    request_id = responses.response_worker.submit(corpus_topics[selected_topic_index], text)
+                    pending_replies.append((request_id, time.time()))
                     if notif_s:
                         pygame.mixer.Sound.play(MESSAGE_S_NOTIF)
                     text = ''
@@ -350,9 +610,10 @@ def chat_window(notif_s, notif_r):
                     message_thread.append([2, topic_strs[selected_topic_index], get_time()])
         
         # window update
+        draw_telemetry_overlay('chat_window')
         pygame.display.update()
-        CLOCK.tick(30)
-        SCREEN.blit(CW_BG_IMAGE, (0,0))
+        tick_frame('chat_window')
+        SCREEN.blit(cw_layer, (0,0))
 
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -379,10 +640,6 @@ def um_main():
     while running:
         mx, my = pygame.mouse.get_pos()
 
-        # drawing click boxes
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), home_icon, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), quit_icon, 0)
-
         # ---------------------------------------------------------------------------------------------------------------------
         # Events
 
@@ -394,6 +651,7 @@ def um_main():
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     click = True
+                    mx, my = event.pos # where the button was pressed
 
         # special case on slide 0, home icon and quit icon 
         if image_index == 0:
@@ -407,12 +665,13 @@ def um_main():
         
         # implementing slideshow 
         if click:
-            image_index = (image_index + 1) % len(UM_IMAGES)
-        image = pygame.image.load(f'{CURRENT_DIR}/images/user_manual_images/{UM_IMAGES[image_index]}')
+            image_index = (image_index + 1) % len(UM_SLIDES)
+        image = UM_SLIDES.get(image_index) # decoded once, the next slide is already decoding in the background
         
         # window update
+        draw_telemetry_overlay('user_manual')
         pygame.display.flip()
-        CLOCK.tick(30)
+        tick_frame('user_manual')
         SCREEN.blit(image, (0,0))
 
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -426,6 +685,9 @@ def menu():
     Calls other screens, dependent on user action
     '''
 
+    # loads the nlp stack and default topic model in the background while the menu is open
+    responses.start_warm_up(WARM_UP_TOPICS, STARTUP_TIMER)
+
     # booleans
     click = False
     message_notif_s = True
@@ -439,17 +701,16 @@ def menu():
     received_notif_button = pygame.Rect(542, 628, 192, 58)
     hover_boxes = [chat_button, help_button, sent_notif_button, received_notif_button]
 
+    # transparent fill and background composited once
+    menu_layer = get_static_layer('menu', MENU_BG_IMAGE, (354, 0))
+
     while True:
         mx, my = pygame.mouse.get_pos()
 
         # ---------------------------------------------------------------------------------------------------------------------
         # Drawing Items
 
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), quit_icon, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), chat_button, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), help_button, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), sent_notif_button, 0)
-        draw_rect_transparent(SCREEN, (0, 0, 0, 0), received_notif_button, 0)
+        # static chrome is in menu_layer, only the notification toggles and hover outlines are drawn per frame
         notification_box_text(message_notif_s, message_notif_r, sent_notif_button, received_notif_button)
 
         # box hover outline
@@ -465,6 +726,7 @@ def menu():
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:
                     click = True
+                    mx, my = event.pos # where the button was pressed
 
         # ---------------------------------------------------------------------------------------------------------------------
         # Clicks
@@ -491,11 +753,57 @@ def menu():
                 message_notif_r = not message_notif_r
 
         # window update
+        draw_telemetry_overlay('menu')
         pygame.display.update()
-        CLOCK.tick(30)
-        SCREEN.fill(TRANSPARENT)
-        SCREEN.blit(MENU_BG_IMAGE, (354,0))
+        STARTUP_TIMER.report_once('first menu frame')
+        tick_frame('menu')
+        SCREEN.blit(menu_layer, (0,0))
     
+# -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
+# Measurement Functions
+
+def benchmark_static_layers(frames=300):
+    '''
+    Measures the per-frame cost of drawing each screen's chrome, before and after pre-compositing
+        - before: transparent fill, unconverted background blit and a new SRCALPHA Surface per click box
+        - after: one blit of the converted static layer
+    Returns milliseconds per frame for each screen and approach
+    '''
+
+    raw_menu_bg = pygame.image.load(f'{CURRENT_DIR}/images/main_menu.tif')
+    raw_cw_bg = pygame.image.load(f'{CURRENT_DIR}/images/cwindow.tif')
+    menu_rects = [(pygame.Rect(891, 7, 24, 24), 0)] + [(pygame.Rect(542, y, 192, 58), 0) for y in (366, 454, 541, 628)]
+    cw_rects = [(pygame.Rect(10, 7, 27, 24), 0), (pygame.Rect(1249, 7, 23, 23), 0), (pygame.Rect(1160, 636, 30, 27), 0), (pygame.Rect(275, 625, 875, 50), 0)]
+    cw_rects += [(pygame.Rect(49, 87 + 66 * i, 143, 46), 4) for i in range(9)]
+
+    def per_frame(draw):
+        start_time = time.perf_counter()
+        for _ in range(frames):
+            draw()
+        return (time.perf_counter() - start_time) / frames * 1000
+
+    def menu_before():
+        SCREEN.fill(TRANSPARENT)
+        SCREEN.blit(raw_menu_bg, (354, 0))
+        for rect, radius in menu_rects:
+            draw_rect_transparent(SCREEN, (0, 0, 0, 0), rect, radius)
+
+    def cw_before():
+        SCREEN.blit(raw_cw_bg, (0, 0))
+        for rect, radius in cw_rects:
+            draw_rect_transparent(SCREEN, (0, 0, 0, 0), rect, radius)
+
+    menu_layer = build_static_layer(MENU_BG_IMAGE, (354, 0))
+    cw_layer = build_static_layer(CW_BG_IMAGE, (0, 0))
+    return {
+        'menu_before_ms': per_frame(menu_before),
+        'menu_after_ms': per_frame(lambda: SCREEN.blit(menu_layer, (0, 0))),
+        'chat_window_before_ms': per_frame(cw_before),
+        'chat_window_after_ms': per_frame(lambda: SCREEN.blit(cw_layer, (0, 0)))
+    }
+
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -507,33 +815,54 @@ SCREEN_WIDTH = 1280
 SCREEN_HEIGHT = 720
 CWMESSAGE_SIZE = 24
 MAX_BUBBLE_LENGTH = 300
+REPLY_DELAY = 0.3 # minimum seconds between a message being sent and the reply appearing
+SHOW_TYPING_INDICATOR = True
+WARM_UP_TOPICS = ['general'] # chat window opens on general chat
+CONVERSATION_PATH = f'{CURRENT_DIR}/conversations/chat'
+CONVERSATION_WINDOW = 200 # messages kept in memory, older ones are read from disk when scrolled back to
+CONVERSATION = None
+FPS = 30 # 0 runs the loops unthrottled
+FRAME_BUDGET_MS = 1000 / 30
+FRAME_HOOK = None
+TELEMETRY_OVERLAY = os.environ.get('KAI_TELEMETRY_OVERLAY') == '1' or '--telemetry-overlay' in sys.argv
+RESPONSE_STAGES = ['responses_main', 'tokenise', 'lemmatise', 'bow', 'model', 'get_response', 'load'] # as timed in responses.py
 
 # pygame initialisation
-pygame.mixer.pre_init()
-pygame.init()
+with STARTUP_TIMER.measure('init', 'pygame.init'):
+    pygame.mixer.pre_init()
+    pygame.init()
 CLOCK = pygame.time.Clock()
-SCREEN = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.NOFRAME)
+with STARTUP_TIMER.measure('init', 'display.set_mode'):
+    SCREEN = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.NOFRAME)
 
 # making the pygame window transparent
 TRANSPARENT = (0, 0, 0)
-hwnd = pygame.display.get_wm_info()["window"]
-win32gui.SetWindowLong(hwnd, win32con.GWL_EXSTYLE, win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE) | win32con.WS_EX_LAYERED)
-win32gui.SetLayeredWindowAttributes(hwnd, win32api.RGB(*TRANSPARENT), 0, win32con.LWA_COLORKEY)
+STATIC_LAYERS = {} # screen name -> pre-composited background layer
+TEXT_WIDTHS = {} # font -> TextWidths
+if not HEADLESS:
+    hwnd = pygame.display.get_wm_info()["window"]
+    win32gui.SetWindowLong(hwnd, win32con.GWL_EXSTYLE, win32gui.GetWindowLong(hwnd, win32con.GWL_EXSTYLE) | win32con.WS_EX_LAYERED)
+    win32gui.SetLayeredWindowAttributes(hwnd, win32api.RGB(*TRANSPARENT), 0, win32con.LWA_COLORKEY)
 
 # images and sounds
-MENU_BG_IMAGE = pygame.image.load(f'{CURRENT_DIR}/images/main_menu.tif')
-CW_BG_IMAGE = pygame.image.load(f'{CURRENT_DIR}/images/cwindow.tif')
-UM_IMAGES = [pic for pic in os.listdir(f'{CURRENT_DIR}/images/user_manual_images/') if pic.endswith('.tif')]
-MESSAGE_S_NOTIF = pygame.mixer.Sound(f'{CURRENT_DIR}/notifications/message_sent.mp3')
-MESSAGE_R_NOTIF = pygame.mixer.Sound(f'{CURRENT_DIR}/notifications/message_received.mp3')
+with STARTUP_TIMER.measure('asset', 'MENU_BG_IMAGE'):
+    MENU_BG_IMAGE = pygame.image.load(f'{CURRENT_DIR}/images/main_menu.tif').convert() # backgrounds are fully opaque
+with STARTUP_TIMER.measure('asset', 'CW_BG_IMAGE'):
+    CW_BG_IMAGE = pygame.image.load(f'{CURRENT_DIR}/images/cwindow.tif').convert()
+UM_SLIDES = slides.SlideCache(slides.find_slides(f'{CURRENT_DIR}/images/user_manual_images'), max_slides=3) # slides are fully opaque
+with STARTUP_TIMER.measure('asset', 'MESSAGE_S_NOTIF'):
+    MESSAGE_S_NOTIF = pygame.mixer.Sound(f'{CURRENT_DIR}/notifications/message_sent.mp3')
+with STARTUP_TIMER.measure('asset', 'MESSAGE_R_NOTIF'):
+    MESSAGE_R_NOTIF = pygame.mixer.Sound(f'{CURRENT_DIR}/notifications/message_received.mp3')
 
 # fonts - CB_14 = Calibri bold, size 14     ;    CBI = Calibri bold italic
-FONT_CB_14 = pygame.font.SysFont('Calibri', 14, bold=True)
-FONT_CB_18 = pygame.font.SysFont('Calibri', 18, bold=True)
-FONT_CB_20 = pygame.font.SysFont('Calibri', 20, bold=True)
-FONT_CI_20 = pygame.font.SysFont('Calibri', 20, italic=True)
-FONT_CBI_TOPIC = pygame.font.SysFont('Calibri', CWMESSAGE_SIZE - 4, bold=True, italic=True)
-FONT_CB_MESSAGE = pygame.font.SysFont('Calibri', CWMESSAGE_SIZE, bold=True)
+with STARTUP_TIMER.measure('asset', 'fonts (6 x SysFont)'):
+    FONT_CB_14 = pygame.font.SysFont('Calibri', 14, bold=True)
+    FONT_CB_18 = pygame.font.SysFont('Calibri', 18, bold=True)
+    FONT_CB_20 = pygame.font.SysFont('Calibri', 20, bold=True)
+    FONT_CI_20 = pygame.font.SysFont('Calibri', 20, italic=True)
+    FONT_CBI_TOPIC = pygame.font.SysFont('Calibri', CWMESSAGE_SIZE - 4, bold=True, italic=True)
+    FONT_CB_MESSAGE = pygame.font.SysFont('Calibri', CWMESSAGE_SIZE, bold=True)
 
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------------
@@ -541,4 +870,8 @@ FONT_CB_MESSAGE = pygame.font.SysFont('Calibri', CWMESSAGE_SIZE, bold=True)
 # Runs Code
 
 if __name__ == '__main__':
-    menu()
+    if '--frame-benchmark' in sys.argv:
+        for key, value in benchmark_static_layers().items():
+            print(f'{key:<24} {value:.3f}')
+    else:
+        menu()
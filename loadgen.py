@@ -0,0 +1,139 @@
+# Load Generator
+
+'''
+Local load-generating client for server.py
+Opens a number of concurrent connections, sends messages drawn from the corpus patterns as fast as replies come back
+and reports p50/p99 latency, requests per second and errors
+Latency and throughput are of the successful replies only, busy and timeout errors come back fast and would hide overload
+
+Usage: python loadgen.py --connections 16 --requests 5000 --topics general football
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Message Functions
+
+def load_messages(topics):
+    '''
+    Gets (topic, pattern) pairs from each topic's corpus to use as request messages
+    '''
+
+    messages = []
+    for topic in topics:
+        with open(f'{current_path}/corpora/{topic}.json', encoding='utf-8') as file:
+            corpus = json.load(file)
+        messages.extend((topic, pattern) for intent in corpus['intents'] for pattern in intent['patterns'])
+    return messages
+
+def percentile(sorted_values, fraction):
+    '''
+    Nearest-rank percentile of an already sorted list
+    '''
+
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Client Functions
+
+async def run_connection(host, port, messages, request_count, latencies, error_latencies, errors):
+    '''
+    Sends request_count requests one after another over a single connection
+    Records each latency in latencies, or in error_latencies if the reply was an error
+    '''
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request_id in range(request_count):
+            topic, message = random.choice(messages)
+            start_time = time.perf_counter()
+            writer.write((json.dumps({'id': request_id, 'topic': topic, 'message': message}) + '\n').encode('utf-8'))
+            await writer.drain()
+            reply = json.loads(await reader.readline())
+            latency = time.perf_counter() - start_time
+            if 'error' in reply:
+                error_latencies.append(latency)
+                errors[reply['error']] = errors.get(reply['error'], 0) + 1
+            else:
+                latencies.append(latency)
+    finally:
+        writer.close()
+
+async def run_load(host, port, topics, connections, requests):
+    '''
+    Spreads the requests over the connections and runs them concurrently
+    Returns the report dictionary
+    '''
+
+    messages = load_messages(topics)
+    latencies = []
+    error_latencies = []
+    errors = {}
+    per_connection = [requests // connections + (1 if i < requests % connections else 0) for i in range(connections)]
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(run_connection(host, port, messages, count, latencies, error_latencies, errors) for count in per_connection))
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        'requests': len(latencies) + len(error_latencies),
+        'successful': len(latencies),
+        'connections': connections,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+        'errors': errors
+    }
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def loadgen_main(argv=None):
+    '''
+    Parses the command line arguments, runs the load and prints the report
+    '''
+
+    parser = argparse.ArgumentParser(description='Load generator for the kAi chat service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--topics', nargs='+', default=['general', 'football'])
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load(args.host, args.port, args.topics, args.connections, args.requests))
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{report['requests']} requests ({report['successful']} successful) over {report['connections']} connections in {report['seconds']:.2f}s")
+        print(f"successful: {report['requests_per_second']:.0f} requests/s, p50 {report['p50_ms']:.2f}ms, p99 {report['p99_ms']:.2f}ms, max {report['max_ms']:.2f}ms")
+        if report['errors']:
+            print(f"errors: {report['errors']}")
+    return report
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    loadgen_main(sys.argv[1:])
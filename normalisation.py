@@ -0,0 +1,379 @@
+# Text Normalisation
+
+'''
+Shared tokenising and normalising used by both training.py and responses.py
+Every token is lowercased then lemmatised, so training and serving always see the same words
+Lemmatisation results are memoised in a bounded LRU cache that can be persisted to disk and reused across training runs
+
+Two tokenisers are available, selected with KAI_TOKENISER or training.py --tokeniser and recorded with each model:
+    nltk   nltk.word_tokenize, needs the NLTK punkt data
+    fast   precompiled port of the same Treebank rules, with a plain split for messages of only words and spaces
+Each model's words file records the tokeniser it was trained with, see save_words()
+Parity with NLTK is checked by tests/test_normalisation.py, throughput with: python normalisation.py [texts.txt]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import re
+import sys
+import json
+import pickle
+import tempfile
+import time
+import threading
+from collections import OrderedDict
+from telemetry import telemetry
+import corpus_stream
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Normaliser Class
+
+class Normaliser:
+    '''
+    Lowercases and lemmatises tokens, memoising results in a bounded LRU cache
+    - WordNet is only loaded on the first cache miss
+    - keeps hit/miss counts so the cache hit rate can be reported
+    '''
+
+    def __init__(self, max_size=None, cache_path=None):
+        self.max_size = max_size
+        self.cache_path = cache_path
+        self.cache = OrderedDict() # raw token -> normalised token
+        self.added = set() # tokens normalised by this process rather than loaded, see new_entries()
+        self.lemmatiser = None
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def normalise(self, token):
+        '''
+        Gets the lowercased lemma of a token, from the cache if it has been seen before
+        '''
+
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            normalised = self.cache.get(token)
+            if normalised is not None:
+                self.hits += 1
+                self.cache.move_to_end(token)
+                return normalised
+
+            self.misses += 1
+            normalised = self.get_lemmatiser().lemmatize(str(token).lower())
+            self.cache[token] = normalised
+            self.added.add(token)
+            if self.max_size is not None and len(self.cache) > self.max_size:
+                self.cache.popitem(last=False) # drops least recently used token
+            return normalised
+
+    def normalise_all(self, tokens):
+        '''
+        Normalises a list of tokens
+        '''
+
+        return [self.normalise(token) for token in tokens]
+
+    def get_lemmatiser(self):
+        '''
+        Creates the WordNet lemmatiser on first use
+        '''
+
+        if self.lemmatiser is None:
+            from nltk.stem import WordNetLemmatizer
+            self.lemmatiser = WordNetLemmatizer()
+        return self.lemmatiser
+
+    def load(self):
+        '''
+        Fills the cache from cache_path if it exists, called automatically on first use
+        '''
+
+        self.loaded = True
+        if self.cache_path and os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, encoding='utf-8') as file:
+                    self.cache.update(json.load(file))
+            except (OSError, ValueError): # unreadable cache is rebuilt rather than fatal
+                self.cache.clear()
+        while self.max_size is not None and len(self.cache) > self.max_size: # saved with a larger max_size
+            self.cache.popitem(last=False)
+
+    def save(self):
+        '''
+        Writes the cache to cache_path, least recently used first so reloading keeps the LRU order
+        '''
+
+        if not self.cache_path:
+            return
+        with self.lock:
+            # a temporary file of its own, so saves from several processes never write or rename the same file
+            fd, temp_path = tempfile.mkstemp(prefix='.lemma_cache_', suffix='.tmp', dir=os.path.dirname(self.cache_path) or None)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    json.dump(self.cache, file)
+                os.replace(temp_path, self.cache_path) # no half written cache if interrupted
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+    def new_entries(self):
+        '''
+        Gets the entries this process normalised itself, for a parent process to merge with update()
+        '''
+
+        with self.lock:
+            return {token: self.cache[token] for token in self.added if token in self.cache}
+
+    def update(self, entries):
+        '''
+        Merges entries normalised elsewhere (e.g. by training workers) in as the most recently used
+        '''
+
+        with self.lock:
+            if not self.loaded:
+                self.load()
+            for token, normalised in entries.items():
+                self.cache[token] = normalised
+                self.cache.move_to_end(token)
+            while self.max_size is not None and len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+
+    def stats(self):
+        '''
+        Returns the cache size, hits, misses and hit rate
+        '''
+
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tokenising Functions
+
+def tokenise(text, tokeniser=None):
+    '''
+    Splits a string into word tokens, using the given tokeniser or the selected TOKENISER
+    '''
+
+    return TOKENISERS[tokeniser or TOKENISER](text)
+
+def nltk_tokenise(text):
+    '''
+    Splits a string into word tokens using nltk
+    '''
+
+    import nltk # deferred until there is text to tokenise
+    return nltk.word_tokenize(text)
+
+def fast_tokenise(text):
+    '''
+    Splits a string into the same word tokens as nltk.word_tokenize, without nltk
+    - chat messages of only words and spaces (most of them) are split on whitespace
+    - anything else is split into sentences, then each sentence goes through the Treebank rules nltk uses
+    '''
+
+    if PLAIN_TEXT.fullmatch(text) and not CONTRACTION_WORDS.search(text):
+        return text.split()
+    return [token for sentence in split_sentences(text) for token in treebank_tokenise(sentence)]
+
+def split_sentences(text):
+    '''
+    Approximates punkt sentence splitting: breaks after . ? ! (and closing quotes or brackets) followed by whitespace,
+    except after a known abbreviation or a single letter initial
+    - only an approximation, punkt also uses abbreviations, collocations and sentence starters learned from its
+      training data, so text with other abbreviations or ordinals such as "the 2. round" can split differently
+    - the Treebank rules applied to each sentence match nltk exactly, only a different split can change the tokens
+    '''
+
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.group(1) == '.':
+            words = text[start:match.start()].split()
+            last_word = words[-1].lower().rstrip('.') if words else ''
+            if last_word in ABBREVIATIONS or (len(last_word) == 1 and last_word.isalpha()):
+                continue
+        sentences.append(text[start:match.start(2)])
+        start = match.end()
+    sentences.append(text[start:])
+    return [sentence for sentence in sentences if sentence.strip()]
+
+def treebank_tokenise(text):
+    '''
+    Tokenises one sentence with the rules of nltk's NLTKWordTokenizer, compiled once in TREEBANK_RULES
+    '''
+
+    for pattern, substitution in TREEBANK_RULES:
+        text = pattern.sub(substitution, text)
+    text = ' ' + text + ' '
+    for pattern, substitution in TREEBANK_PADDED_RULES:
+        text = pattern.sub(substitution, text)
+    return text.split()
+
+def set_tokeniser(tokeniser):
+    '''
+    Selects the tokeniser used when none is given, also for spawned training workers
+    '''
+
+    global TOKENISER
+    if tokeniser not in TOKENISERS:
+        raise ValueError(f'unknown tokeniser {tokeniser}, choose from {", ".join(TOKENISERS)}')
+    TOKENISER = tokeniser
+    os.environ['KAI_TOKENISER'] = tokeniser
+
+def save_words(words, path, tokeniser=None):
+    '''
+    Saves a model's vocabulary together with the tokeniser it was built with (the selected TOKENISER if not given),
+    so the words file alone says how messages must be tokenised, as bundle metadata does for .kai files
+    '''
+
+    with open(path, 'wb') as file:
+        pickle.dump({'words': words, 'tokeniser': tokeniser or TOKENISER}, file)
+
+def load_words(path, model_name):
+    '''
+    Loads a words file, returns (words, tokeniser)
+    - words files written before the tokeniser was stored in them are a plain list, see artifact_tokeniser()
+    '''
+
+    with open(path, 'rb') as file:
+        words = pickle.load(file)
+    if isinstance(words, dict):
+        return words['words'], words['tokeniser']
+    return words, artifact_tokeniser(model_name)
+
+def artifact_tokeniser(model_name):
+    '''
+    Gets the tokeniser of a model with an old words file from the build manifest, models built before it was recorded used nltk
+    '''
+
+    try:
+        with open(f'{current_path}/models/manifest.json') as file:
+            entry = json.load(file)['topics'].get(model_name) or {}
+    except (OSError, ValueError):
+        entry = {}
+    return entry.get('tokeniser', 'nltk')
+
+def clean_up(text, tokeniser=None):
+    '''
+    Tokenises then normalises a string, the same processing for training patterns and user messages
+    '''
+
+    with telemetry.stage('tokenise'):
+        tokens = tokenise(text, tokeniser)
+    with telemetry.stage('lemmatise'):
+        return normaliser.normalise_all(tokens)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Throughput Functions
+
+def corpus_texts():
+    '''
+    Gets every pattern of every corpus in corpora/
+    '''
+
+    texts = []
+    for corpus_file in corpus_stream.list_corpora(f'{current_path}/corpora'):
+        texts.extend(pattern for pattern, tag in corpus_stream.read_patterns(f'{current_path}/corpora/{corpus_file}'))
+    return texts
+
+def compare_throughput(texts, repeat=20):
+    '''
+    Messages per second of each tokeniser over the texts
+    '''
+
+    results = {}
+    for name, tokenise_function in TOKENISERS.items():
+        tokenise_function(texts[0]) # loads nltk and punkt outside the timing
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                tokenise_function(text)
+        results[name] = repeat * len(texts) / (time.perf_counter() - start_time)
+    return results
+
+def normalisation_main(argv):
+    '''
+    Compares the throughput of the tokenisers on the corpora, plus any text files given (one message a line)
+    '''
+
+    texts = corpus_texts()
+    for path in argv:
+        with open(path, encoding='utf-8') as file:
+            texts.extend(line.rstrip('\n') for line in file if line.strip())
+
+    for name, rate in compare_throughput(texts).items():
+        print(f'{name:<6} {rate:>12,.0f} messages/s')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+CACHE_SIZE = 50000 # tokens, a few MB at most
+normaliser = Normaliser(max_size=CACHE_SIZE, cache_path=f'{current_path}/models/lemma_cache.json')
+TOKENISERS = {'nltk': nltk_tokenise, 'fast': fast_tokenise}
+TOKENISER = os.environ.get('KAI_TOKENISER', 'nltk')
+
+# fast tokeniser patterns
+PLAIN_TEXT = re.compile(r'[A-Za-z0-9 ]*')
+CONTRACTION_WORDS = re.compile(r'(?i)\b(?:cannot|gimme|gonna|gotta|lemme|wanna)\b') # split by the Treebank rules
+SENTENCE_END = re.compile(r'([.?!])[\]\)}>"\'»”’]*(\s+)(?=\S)')
+ABBREVIATIONS = {'mr', 'mrs', 'ms', 'dr', 'prof', 'st', 'vs', 'etc', 'e.g', 'i.e', 'jr', 'sr', 'no', 'inc', 'ltd', 'co'}
+
+# rules of nltk.tokenize.destructive.NLTKWordTokenizer, in order
+TREEBANK_RULES = [(re.compile(pattern), substitution) for pattern, substitution in [
+    # starting quotes
+    (r'([«“‘„]|[`]+)', r' \1 '),
+    (r'^\"', r'``'),
+    (r'(``)', r' \1 '),
+    (r'([ \(\[{<])(\"|\'{2})', r'\1 `` '),
+    (r"(?i)(?<!\w)(\')(?!(?:re|ve|ll|m|t|s|d|n)\b)(?=\w)", r'\1 '),
+    # punctuation
+    (r'([^\.])(\.)([\]\)}>"\'' '»”’ ' r']*)\s*$', r'\1 \2 \3 '),
+    (r'([:,])([^\d])', r' \1 \2'),
+    (r'([:,])$', r' \1 '),
+    (r'\.{2,}', r' \g<0> '),
+    (r'[;@#$%&]', r' \g<0> '),
+    (r'[\u2012-\u2015]', r' \g<0> '),
+    (r'([^\.])(\.)([\]\)}>"\']*)\s*$', r'\1 \2\3 '),
+    (r'[?!]', r' \g<0> '),
+    (r"([^'])' ", r"\1 ' "),
+    (r'[*]', r' \g<0> '),
+    # parentheses and double dashes
+    (r'[\]\[\(\)\{\}\<\>]', r' \g<0> '),
+    (r'--', r' -- ')
+]]
+TREEBANK_PADDED_RULES = [(re.compile(pattern), substitution) for pattern, substitution in [
+    # ending quotes
+    (r'([»”’])', r' \1 '),
+    (r"''", " '' "),
+    (r'"', " '' "),
+    (r'\s+', ' '),
+    (r"([^' ])('[sS]|'[mM]|'[dD]|') ", r'\1 \2 '),
+    (r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) ", r'\1 \2 '),
+    # contractions
+    (r"(?i)\b(can)(?#X)(not)\b", r' \1 \2 '),
+    (r"(?i)\b(d)(?#X)('ye)\b", r' \1 \2 '),
+    (r"(?i)\b(gim)(?#X)(me)\b", r' \1 \2 '),
+    (r"(?i)\b(gon)(?#X)(na)\b", r' \1 \2 '),
+    (r"(?i)\b(got)(?#X)(ta)\b", r' \1 \2 '),
+    (r"(?i)\b(lem)(?#X)(me)\b", r' \1 \2 '),
+    (r"(?i)\b(more)(?#X)('n)\b", r' \1 \2 '),
+    (r"(?i)\b(wan)(?#X)(na)(?=\s)", r' \1 \2 '),
+    (r"(?i) ('t)(?#X)(is)\b", r' \1 \2 '),
+    (r"(?i) ('t)(?#X)(was)\b", r' \1 \2 ')
+]]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    normalisation_main(sys.argv[1:])
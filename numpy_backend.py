@@ -0,0 +1,182 @@
+# NumPy Inference Backend
+
+'''
+TensorFlow-free inference for the trained models
+Exports the Dense layers of each models/{topic}_model.h5 to plain weight arrays in models/{topic}_weights.npz
+Runs the forward pass with numpy only, so inference-only deployments do not need TensorFlow installed
+Exporting still needs keras, run once after training: python numpy_backend.py [topic ...]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import numpy
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Activation Functions
+
+def relu(x):
+    '''
+    Rectified Linear Unit, negative values become 0
+    '''
+
+    return numpy.maximum(x, 0)
+
+def softmax(x):
+    '''
+    Softmax over the last axis, shifted by the row maximum for numerical stability
+    '''
+
+    exps = numpy.exp(x - x.max(axis=-1, keepdims=True))
+    return exps / exps.sum(axis=-1, keepdims=True)
+
+def linear(x):
+    return x
+
+def gather_product(x, kernel):
+    '''
+    x @ kernel for a sparse x such as a bag of words, reading only the kernel rows of x's nonzero columns
+    - only those rows are converted to float32, the kernel itself keeps its compressed dtype
+    '''
+
+    rows, columns = x.nonzero()
+    product = numpy.zeros((len(x), kernel.shape[1]), dtype=numpy.float32)
+    numpy.add.at(product, rows, kernel[columns].astype(numpy.float32) * x[rows, columns, None])
+    return product
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Model Class
+
+class NumpyModel:
+    '''
+    Forward pass of a stack of Dense layers using numpy
+    - called the same way as a keras model: model(inputs, training=False) returns a (batch, classes) array
+    - dropout layers are skipped as they only apply during training
+    - scales are the per-layer scales of int8 kernels from compression.py, None for unscaled kernels
+    Compressed (int8 / float16) kernels are never upcast whole on a call:
+    - the first layer gathers only the kernel rows of the words present in each bag of words,
+      so its cost and temporary memory grow with the message length rather than the vocabulary
+    - later layers take dense inputs, so their kernels are dequantised to float32 once when the model is created and kept,
+      these hidden x hidden kernels do not grow with the vocabulary, and the first layer stays compressed in memory
+    '''
+
+    def __init__(self, layers, scales=None):
+        self.layers = layers # list of (kernel, bias, activation name)
+        self.scales = scales # list of float or None per layer
+        self.dense_kernels = [None] * len(layers) # float32 copies of the compressed kernels after the first
+        for i, (kernel, bias, activation) in enumerate(layers[1:], 1):
+            if kernel.dtype != numpy.float32:
+                self.dense_kernels[i] = numpy.asarray(kernel, dtype=numpy.float32) * numpy.float32(self.scale(i))
+
+    def __call__(self, inputs, training=False):
+        x = numpy.asarray(inputs, dtype=numpy.float32)
+        for i, (kernel, bias, activation) in enumerate(self.layers):
+            if kernel.dtype == numpy.float32:
+                x = x @ kernel
+            elif self.dense_kernels[i] is not None:
+                x = x @ self.dense_kernels[i]
+            else:
+                x = gather_product(x, kernel) * numpy.float32(self.scale(i))
+            x = ACTIVATIONS[activation](x + bias)
+        return x
+
+    def scale(self, i):
+        if self.scales and self.scales[i] is not None:
+            return self.scales[i]
+        return 1.0
+
+    def get_weights(self):
+        '''
+        Flat list of weight arrays, in the same order as keras get_weights()
+        '''
+
+        weights = []
+        for kernel, bias, activation in self.layers:
+            weights.extend([kernel, bias])
+        return weights
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Export + Load Functions
+
+def export_weights(model_name):
+    '''
+    Converts models/{model_name}_model.h5 into models/{model_name}_weights.npz
+    '''
+
+    from keras.models import load_model # only the exporter needs keras
+
+    model = load_model(f'{current_path}/models/{model_name}_model.h5')
+    export_model(model, f'{current_path}/models/{model_name}_weights.npz')
+
+def export_model(model, path):
+    '''
+    Saves the Dense layers of an in-memory keras model as a weights file
+    - stores kernel_i, bias_i and activation_i for every Dense layer in order
+    '''
+
+    arrays = {}
+    dense_layers = [layer for layer in model.layers if layer.get_weights()] # dropout layers have no weights
+    for i, layer in enumerate(dense_layers):
+        kernel, bias = layer.get_weights()
+        arrays[f'kernel_{i}'] = kernel.astype(numpy.float32)
+        arrays[f'bias_{i}'] = bias.astype(numpy.float32)
+        arrays[f'activation_{i}'] = numpy.array(layer.get_config()['activation'])
+    numpy.savez(path, **arrays)
+
+def load_numpy_model(path):
+    '''
+    Loads an exported weights file into a NumpyModel
+    '''
+
+    layers = []
+    with numpy.load(path) as arrays:
+        i = 0
+        while f'kernel_{i}' in arrays:
+            layers.append((arrays[f'kernel_{i}'], arrays[f'bias_{i}'], str(arrays[f'activation_{i}'])))
+            i += 1
+    return NumpyModel(layers)
+
+def check_export(model_name, samples=64, tolerance=1e-5):
+    '''
+    Compares the numpy forward pass against keras on random binary bags of words
+    Returns the maximum absolute difference in probabilities, raising if it is over the tolerance
+    '''
+
+    from keras.models import load_model
+
+    keras_model = load_model(f'{current_path}/models/{model_name}_model.h5')
+    numpy_model = load_numpy_model(f'{current_path}/models/{model_name}_weights.npz')
+    inputs = numpy.random.default_rng(0).integers(0, 2, size=(samples, numpy_model.layers[0][0].shape[0]))
+    difference = numpy.abs(numpy.asarray(keras_model(inputs, training=False)) - numpy_model(inputs)).max()
+    if difference > tolerance:
+        raise ValueError(f'{model_name}: numpy backend differs from keras by {difference}')
+    return difference
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def export_main(model_names):
+    '''
+    Exports and checks every given model, or every .h5 model in models/ if none are given
+    '''
+
+    if not model_names:
+        model_names = [file[:-len('_model.h5')] for file in os.listdir(f'{current_path}/models/') if file.endswith('_model.h5')]
+    for model_name in model_names:
+        export_weights(model_name)
+        difference = check_export(model_name)
+        print(f'{model_name}: exported, max difference from keras {difference:.2e}')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+ACTIVATIONS = {'relu': relu, 'softmax': softmax, 'linear': linear}
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    export_main(sys.argv[1:])
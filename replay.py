@@ -0,0 +1,274 @@
+# Headless Replay Harness
+
+'''
+Drives the chat window without a display to load test rendering
+Runs graphics.py on SDL's dummy video driver (no win32 window setup), feeds a scripted transcript of keystrokes,
+sends, topic clicks and scrolls through the real event loop, one step per frame, with the frame rate unthrottled
+Reports frame time percentiles and peak memory per scenario, each scenario runs in its own process so peaks are separate
+
+Scenario steps (JSON):
+    {"click": [x, y]}           left click at a screen position
+    {"topic": "Football"}       click a topic button
+    {"type": "hello"}           one key press per frame
+    {"paste": "long text"}      every key press in one frame
+    {"send": true}              return key
+    {"scroll": 1}               mouse wheel, positive scrolls back
+    {"wait": 10}                frames without input
+    {"wait_seconds": 0.5}       frames without input until the time has passed, e.g. for replies
+A scenario is {"name": ..., "seed_messages": 0, "steps": [...]}, seed_messages pre-fills the conversation
+
+Usage: python replay.py [--scenarios typing long_thread] [--script scenarios.json] [--output results.json]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+from loadgen import percentile
+try:
+    import resource # peak resident memory, not available on Windows
+except ImportError:
+    resource = None
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Scenario Functions
+
+def corpus_patterns(topic):
+    with open(f'{current_path}/corpora/{topic}.json', encoding='utf-8') as file:
+        corpus = json.load(file)
+    return [pattern for intent in corpus['intents'] for pattern in intent['patterns']]
+
+def built_in_scenarios():
+    '''
+    Scenarios covering typing and sending with replies, a very long thread, rapid topic switching and a long paste
+    '''
+
+    rng = random.Random(0)
+    patterns = corpus_patterns('general')
+
+    typing = [{'click': MESSAGE_BOX_POSITION}]
+    for _ in range(30):
+        typing += [{'type': rng.choice(patterns)}, {'send': True}, {'wait_seconds': 0.35}]
+
+    long_thread = [{'wait': 60}] + [{'scroll': 1}] * 300 + [{'scroll': -1}] * 300
+
+    topic_switching = [{'topic': TOPIC_NAMES[i % len(TOPIC_NAMES)]} for i in range(600)]
+
+    paste_text = ' '.join(rng.choice(patterns) for _ in range(400))
+    long_paste = [{'click': MESSAGE_BOX_POSITION}]
+    for _ in range(10):
+        long_paste += [{'paste': paste_text}, {'send': True}, {'wait_seconds': 0.35}]
+
+    return {
+        'typing': {'name': 'typing', 'seed_messages': 0, 'steps': typing},
+        'long_thread': {'name': 'long_thread', 'seed_messages': 10000, 'steps': long_thread},
+        'topic_switching': {'name': 'topic_switching', 'seed_messages': 200, 'steps': topic_switching},
+        'long_paste': {'name': 'long_paste', 'seed_messages': 0, 'steps': long_paste}
+    }
+
+def seed_conversation(graphics, store, message_count):
+    '''
+    Fills a conversation store with alternating user and AI messages, and a topic change every 50 messages
+    '''
+
+    rng = random.Random(1)
+    patterns = corpus_patterns('general')
+    for i in range(message_count):
+        if i % 50 == 0:
+            store.append([2, TOPIC_NAMES[(i // 50) % len(TOPIC_NAMES)], '00:00'])
+        lines = graphics.message_split(graphics.FONT_CB_20, rng.choice(patterns), graphics.MAX_BUBBLE_LENGTH)
+        store.append([i % 2, lines, '00:00'])
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Replay Classes
+
+class ReplayFinished(Exception):
+    '''
+    Raised from the frame hook to leave the chat window loop once the script has run
+    '''
+
+class Replay:
+    '''
+    Frame hook that posts each scripted step as pygame events and times every frame
+    '''
+
+    def __init__(self, pygame, steps):
+        self.pygame = pygame
+        self.steps = expand_steps(steps)
+        self.position = 0
+        self.wait_until = None
+        self.frame_times = []
+        self.last_frame = None
+
+    def on_frame(self, loop_name):
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+        self.last_frame = now
+
+        if self.wait_until is not None:
+            if now < self.wait_until:
+                return
+            self.wait_until = None
+        if self.position >= len(self.steps):
+            raise ReplayFinished
+        step = self.steps[self.position]
+        self.position += 1
+        self.post(step)
+
+    def post(self, step):
+        '''
+        Posts the events of one step, read by the loop on its next frame
+        '''
+
+        pygame = self.pygame
+        if 'click' in step:
+            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=tuple(step['click'])))
+        elif 'topic' in step:
+            position = (120, 110 + 66 * TOPIC_NAMES.index(step['topic'])) # centre of the topic button in graphics.chat_window
+            pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=position))
+        elif 'key' in step:
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=0, unicode=step['key'], mod=0))
+        elif 'paste' in step:
+            for chr in step['paste']:
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=0, unicode=chr, mod=0))
+        elif 'send' in step:
+            pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=pygame.K_RETURN, unicode='\r', mod=0))
+        elif 'scroll' in step:
+            pygame.event.post(pygame.event.Event(pygame.MOUSEWHEEL, x=0, y=step['scroll'], flipped=False))
+        elif 'wait_seconds' in step:
+            self.wait_until = time.perf_counter() + step['wait_seconds']
+
+def expand_steps(steps):
+    '''
+    Splits typing into one key press step per character and waits into one step per frame
+    '''
+
+    expanded = []
+    for step in steps:
+        if 'type' in step:
+            expanded.extend({'key': chr} for chr in step['type'])
+        elif 'wait' in step:
+            expanded.extend({} for _ in range(step['wait']))
+        else:
+            expanded.append(step)
+    return expanded
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Run Functions
+
+def peak_memory_mb():
+    '''
+    Peak resident memory of this process in MB, None where it cannot be read
+    '''
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024 # bytes on macOS, KB on Linux
+
+def run_scenario(scenario):
+    '''
+    Runs one scenario through graphics.chat_window in this process and returns its report
+    '''
+
+    os.environ['KAI_HEADLESS'] = '1'
+    import pygame
+    import graphics
+    import conversation
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = conversation.ConversationStore(f'{directory}/chat', window=graphics.CONVERSATION_WINDOW)
+        seed_conversation(graphics, store, scenario.get('seed_messages', 0))
+        graphics.CONVERSATION = store # the saved conversation is never touched
+        graphics.FPS = 0
+        replay = Replay(pygame, scenario['steps'])
+        graphics.FRAME_HOOK = replay.on_frame
+
+        start_time = time.perf_counter()
+        try:
+            graphics.chat_window(False, False)
+        except ReplayFinished:
+            pass
+        elapsed = time.perf_counter() - start_time
+        thread_length = len(store)
+        store.close()
+
+    frame_times = sorted(replay.frame_times)
+    return {
+        'scenario': scenario['name'],
+        'frames': len(frame_times),
+        'seconds': elapsed,
+        'thread_length': thread_length,
+        'mean_ms': sum(frame_times) / len(frame_times) * 1000 if frame_times else 0.0,
+        'p50_ms': percentile(frame_times, 0.50) * 1000,
+        'p95_ms': percentile(frame_times, 0.95) * 1000,
+        'p99_ms': percentile(frame_times, 0.99) * 1000,
+        'max_ms': (frame_times[-1] if frame_times else 0.0) * 1000,
+        'peak_memory_mb': peak_memory_mb()
+    }
+
+def run_in_process(name, script):
+    '''
+    Runs a scenario in a fresh process, so its peak memory is its own
+    '''
+
+    command = [sys.executable, os.path.abspath(__file__), '--run-scenario', name]
+    if script:
+        command += ['--script', script]
+    output = subprocess.run(command, capture_output=True, text=True, check=True, cwd=current_path).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def replay_main(argv=None):
+    '''
+    Parses the command line arguments, runs each scenario and prints or writes the reports
+    '''
+
+    parser = argparse.ArgumentParser(description='Headless scripted replay of the kAi chat window')
+    parser.add_argument('--scenarios', nargs='*', help='scenario names, all of them if not given')
+    parser.add_argument('--script', help='JSON file of extra scenarios')
+    parser.add_argument('--output', help='JSON results file')
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    scenarios = built_in_scenarios()
+    if args.script:
+        with open(args.script, encoding='utf-8') as file:
+            scenarios.update({scenario['name']: scenario for scenario in json.load(file)})
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(scenarios[args.run_scenario])))
+        return
+
+    reports = [run_in_process(name, args.script) for name in (args.scenarios or scenarios)]
+    print(f"{'scenario':<18} {'frames':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'peak MB':>8}")
+    for report in reports:
+        peak = f"{report['peak_memory_mb']:.0f}" if report['peak_memory_mb'] is not None else '-'
+        print(f"{report['scenario']:<18} {report['frames']:>7} {report['p50_ms']:>8.2f} {report['p95_ms']:>8.2f} {report['p99_ms']:>8.2f} {report['max_ms']:>8.2f} {peak:>8}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, indent=4)
+    return reports
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+TOPIC_NAMES = ['General Chat', 'Anime', 'Kpop', 'Films', 'Games', 'Football', 'Your life', 'Your day', 'School'] # as in graphics.chat_window
+MESSAGE_BOX_POSITION = [700, 650]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    replay_main(sys.argv[1:])
@@ -0,0 +1,86 @@
+# Compiled Response Tables
+
+'''
+Compiles the responses of a corpus into a table indexed by class index, saved alongside the model
+Response selection at runtime is then a list index rather than a scan of corpus['intents']
+and the corpus JSON does not need to be loaded to answer messages
+Tables for existing models can be built with: python response_table.py [topic ...]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import json
+import pickle
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Compile Functions
+
+def corpus_responses(corpus):
+    '''
+    Maps each tag in a corpus to its response pool
+    - if a tag appears in more than one intent the last one is used, as get_response() did
+    - intents without responses are skipped, line-delimited corpora only give them on one line of each tag
+    '''
+
+    return {intent['tag']: intent['responses'] for intent in corpus['intents'] if 'responses' in intent}
+
+def compile_response_table(tag_responses, word_classes):
+    '''
+    Creates the response table, entry i is the response pool for word_classes[i]
+    - pools keep nested multi-bubble responses e.g. ["Hi im Kai", "Im an AI"] as lists
+    '''
+
+    return [tag_responses[tag] for tag in word_classes]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# File Functions
+
+def save_response_table(table, path):
+    '''
+    Saves a response table as JSON
+    '''
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(table, file)
+
+def load_response_table(path):
+    '''
+    Loads a response table saved by save_response_table()
+    '''
+
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def response_table_main(model_names):
+    '''
+    Builds models/{topic}_responses.json for the given topics, or for every trained topic if none are given
+    - uses the classes pickle and corpus JSON of an already trained model
+    '''
+
+    if not model_names:
+        model_names = [file[:-len('_classes.pkl')] for file in os.listdir(f'{current_path}/models/') if file.endswith('_classes.pkl')]
+    for model_name in model_names:
+        with open(f'{current_path}/models/{model_name}_classes.pkl', 'rb') as file:
+            word_classes = pickle.load(file)
+        with open(f'{current_path}/corpora/{model_name}.json', encoding='utf-8') as file:
+            corpus = json.load(file)
+        table = compile_response_table(corpus_responses(corpus), word_classes)
+        save_response_table(table, f'{current_path}/models/{model_name}_responses.json')
+        print(f'{model_name}: {len(table)} response pools')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    response_table_main(sys.argv[1:])
@@ -4,6 +4,7 @@
 Takes input from cwi.py and passes into model
 Best response is gained
 Response outputted to cwi.py for display
+Models are kept resident per topic in a bounded LRU cache of engines
 '''
 
 # ---------------------------------------------------------------------------------------------------------------------
@@ -13,22 +14,28 @@ import os
 import pickle
 import random
 import json
+import queue
+import threading
+from collections import OrderedDict
 import numpy
-import nltk
-from nltk.stem import WordNetLemmatizer
-from keras.models import load_model
+import normalisation
+import bundle
+import numpy_backend
+import response_table
+import timing
+from telemetry import telemetry
 
 # ---------------------------------------------------------------------------------------------------------------------
 # BOW Functions
 
-def message_clean_up(message_text):
+def message_clean_up(message_text, tokeniser=None):
     '''
-    Processing input string - tokenising and lemmatising
+    Processing input string - tokenising, lowercasing and lemmatising
+    - uses the same normalisation as training, so message words match the trained vocabulary
+    - tokeniser should be the one the model was trained with, see normalisation.load_words()
     '''
 
-    message_words = nltk.word_tokenize(message_text)
-    message_words = [lemmatiser.lemmatize(word) for word in message_words]
-    return message_words
+    return normalisation.clean_up(message_text, tokeniser)
 
 def bow(message_text, words):
     '''
@@ -46,18 +53,59 @@ def bow(message_text, words):
                 bag[i] = 1
     return numpy.array(bag)
 
+def bow_index(words):
+    '''
+    Creates the vocabulary index used by bow_encode(), mapping each training word to its position
+    - built once per model rather than once per message
+    '''
+
+    return {word: i for i, word in enumerate(words)}
+
+def bow_encode(message_texts, word_index, tokeniser=None):
+    '''
+    Vectorised Bag of Words, fills a preallocated numpy buffer by scatter using the vocabulary index
+        - a single message string returns a 1D binary array, identical to bow()
+        - a list of messages returns a 2D matrix with one row per message
+    '''
+
+    single = isinstance(message_texts, str)
+    if single:
+        message_texts = [message_texts]
+    bags = numpy.zeros((len(message_texts), len(word_index)), dtype=int) # same dtype numpy.array() gives bow()
+
+    # each token is a single dict lookup rather than a scan of the vocabulary
+    for row, message_text in enumerate(message_texts):
+        indices = [word_index[m_word] for m_word in message_clean_up(message_text, tokeniser) if m_word in word_index]
+        bags[row, indices] = 1
+    if single:
+        return bags[0]
+    return bags
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Class Prediction + Response Retrieval Functions
 
-def get_probabilities(message_text, words, model):
+def get_probabilities(message_text, words, model, word_index=None, tokeniser=None):
     '''
     Passes the bag of words into the model, gets probablilities of word classes
     Filters the probablilites to get probablitity and index
+    - word_index should be passed in by long-lived callers, otherwise it is rebuilt from words
     '''
 
-    bag_of_words = bow(message_text, words)
-    prediction = model(numpy.array([bag_of_words]), training=False)[0] # returns an array of probabilities
-    results = [[i, result] for i, result in enumerate(prediction) if result > ERROR_THRESHOLD] # filters insignificant results
+    return get_batch_probabilities([message_text], words, model, word_index, tokeniser)[0]
+
+def get_batch_probabilities(message_texts, words, model, word_index=None, tokeniser=None):
+    '''
+    Batched get_probabilities(), runs a list of messages through the model in one forward pass
+    Returns one filtered [index, probability] list per message
+    '''
+
+    if word_index is None:
+        word_index = bow_index(words)
+    with telemetry.stage('bow'): # includes the tokenise and lemmatise stages
+        bags_of_words = bow_encode(list(message_texts), word_index, tokeniser)
+    with telemetry.stage('model'):
+        predictions = numpy.asarray(model(bags_of_words, training=False)) # returns a row of probabilities per message
+    results = [[[i, result] for i, result in enumerate(prediction) if result > ERROR_THRESHOLD] for prediction in predictions] # filters insignificant results
     return results
 
 def get_class(results, word_classes):
@@ -65,11 +113,18 @@ def get_class(results, word_classes):
     Sorts results to get the top class prediction and class tag
     '''
 
-    results.sort(key=lambda x:x[1], reverse=True) # sorts highest to lowest
-    class_index = results[0][0]
+    class_index = get_class_index(results)
     class_tag = word_classes[class_index]
     return class_tag
 
+def get_class_index(results):
+    '''
+    Sorts results to get the index of the top class prediction
+    '''
+
+    results.sort(key=lambda x:x[1], reverse=True) # sorts highest to lowest
+    return results[0][0]
+
 def get_response(class_tag, corpus):
     '''
     Gets a random response from within the selected class
@@ -81,30 +136,430 @@ def get_response(class_tag, corpus):
             chatbot_response = random.choice(i['responses'])
     return chatbot_response
 
+def get_indexed_response(class_index, response_table):
+    '''
+    Gets a random response for a class index from the compiled response table, O(1) in the number of intents
+    '''
+
+    return random.choice(response_table[class_index])
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Backend Functions
+
+def load_topic_model(path):
+    '''
+    Loads a topic model using the selected backend
+    - keras: the trained .h5 model, needs TensorFlow
+    - numpy: the exported weights from numpy_backend.py, needs numpy only
+    - bundle: models are loaded with the rest of the bundle by ResponseEngine.load_bundle() instead
+    '''
+
+    if BACKEND == 'numpy':
+        return numpy_backend.load_numpy_model(path)
+    from keras.models import load_model # imported here so the numpy backend never needs TensorFlow
+    return load_model(path)
+
+def set_backend(backend):
+    '''
+    Selects the inference backend ('keras', 'numpy' or 'bundle') and unloads engines built with the previous one
+    '''
+
+    global BACKEND
+    if backend not in MODEL_SUFFIXES:
+        raise ValueError(f'unknown backend {backend!r}, expected one of {list(MODEL_SUFFIXES)}')
+    BACKEND = backend
+    engine_cache.clear()
+
+def set_unified(unified):
+    '''
+    Switches between one model per topic and the single unified model from training.py --unified
+    '''
+
+    global UNIFIED
+    UNIFIED = unified
+    engine_cache.clear()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Inference Engine Classes
+
+class ResponseEngine:
+    '''
+    Long-lived inference engine for a single topic
+    - loads the vocabulary, word classes, model and response table once and keeps them in memory
+    - models trained before response tables existed fall back to compiling one from the corpus JSON
+    - the bundle backend reads everything from the single memory mapped models/{topic}.kai file instead
+    - records artifact modification times so a retrained model is picked up without restarting
+    '''
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        if BACKEND == 'bundle':
+            self.paths = {'bundle': f'{current_path}/models/{model_name}{MODEL_SUFFIXES[BACKEND]}'}
+            self.load()
+            return
+
+        self.paths = {
+            'words': f'{current_path}/models/{model_name}_words.pkl',
+            'classes': f'{current_path}/models/{model_name}_classes.pkl',
+            'model': f'{current_path}/models/{model_name}{MODEL_SUFFIXES[BACKEND]}',
+            'responses': f'{current_path}/models/{model_name}_responses.json'
+        }
+        if not os.path.exists(self.paths['responses']):
+            self.paths['corpus'] = f'{current_path}/corpora/{model_name}.json'
+        self.load()
+
+    def load(self):
+        '''
+        Loads every artifact for the topic from disk
+        - only called on a new engine, EngineCache replaces a stale engine rather than reloading it
+        '''
+
+        telemetry.count('engine_loads')
+        with telemetry.stage('load'):
+            if 'bundle' in self.paths:
+                self.load_bundle()
+            else:
+                self.load_artifacts()
+
+    def load_artifacts(self):
+        '''
+        Loads the separate words, classes, model and response table files
+        '''
+
+        self.words, self.tokeniser = normalisation.load_words(self.paths['words'], self.model_name)
+        self.word_index = bow_index(self.words)
+        with open(self.paths['classes'], 'rb') as file:
+            self.word_classes = pickle.load(file)
+        self.model = load_topic_model(self.paths['model'])
+        if 'corpus' in self.paths:
+            with open(self.paths['corpus']) as file:
+                corpus = json.loads(file.read())
+            self.response_table = response_table.compile_response_table(response_table.corpus_responses(corpus), self.word_classes)
+        else:
+            self.response_table = response_table.load_response_table(self.paths['responses'])
+        self.mtimes = self.get_mtimes()
+        self.size = self.estimate_size()
+
+    def load_bundle(self):
+        '''
+        Loads every artifact from the topic's bundle, weight tensors are memory mapped rather than copied
+        '''
+
+        loaded = bundle.load_bundle(self.paths['bundle'])
+        self.words = loaded.words
+        self.word_index = bow_index(self.words)
+        self.word_classes = loaded.word_classes
+        self.model = loaded.model
+        self.tokeniser = loaded.metadata.get('tokeniser', 'nltk') # bundles written before the fast tokeniser existed
+        self.response_table = loaded.response_table
+        self.mtimes = self.get_mtimes()
+        self.size = self.estimate_size()
+
+    def get_mtimes(self):
+        '''
+        Gets the current modification time of every artifact
+        '''
+
+        return {key: os.path.getmtime(path) for key, path in self.paths.items()}
+
+    def estimate_size(self):
+        '''
+        Estimates resident size in bytes - model weights plus the on-disk size of the other artifacts
+        - includes the float32 copies a NumpyModel keeps of its compressed later layers (dense_kernels)
+        '''
+
+        weights_size = sum(weights.nbytes for weights in self.model.get_weights())
+        weights_size += sum(kernel.nbytes for kernel in getattr(self.model, 'dense_kernels', []) if kernel is not None)
+        other_size = sum(os.path.getsize(path) for key, path in self.paths.items() if key not in ('model', 'bundle'))
+        return weights_size + other_size
+
+    def is_stale(self):
+        '''
+        Checks if any artifact has changed on disk since it was loaded, e.g. after retraining
+        '''
+
+        try:
+            return self.get_mtimes() != self.mtimes
+        except OSError: # artifact mid-rewrite or removed, keep serving what is loaded
+            return False
+
+    def respond(self, message_text):
+        '''
+        Gets the ai response for a message using the resident artifacts
+        '''
+
+        results = get_probabilities(message_text, self.words, self.model, self.word_index, self.tokeniser)
+        with telemetry.stage('get_response'):
+            class_index = get_class_index(results)
+            return get_indexed_response(class_index, self.response_table)
+
+class UnifiedEngine(ResponseEngine):
+    '''
+    Engine for the single multi-topic model built by training.py --unified
+    - one shared vocabulary and network serve every topic, so switching topic loads nothing
+    - view(topic) gives an object with the same interface as a single topic ResponseEngine
+    '''
+
+    def __init__(self):
+        super().__init__(UNIFIED_NAME)
+
+    def load(self):
+        '''
+        Loads the shared artifacts then splits the classes and response tables per topic
+        - word_classes is {topic: classes} and response_table is {topic: table} for the unified model
+        '''
+
+        super().load()
+        self.topics = sorted(self.word_classes)
+        self.views = {}
+        class_offset = 0
+        for topic_position, topic in enumerate(self.topics):
+            class_slice = slice(class_offset, class_offset + len(self.word_classes[topic]))
+            class_offset = class_slice.stop
+            topic_model = TopicModel(self.model, topic_position, len(self.topics), class_slice)
+            self.views[topic] = TopicView(self, topic, topic_model)
+
+    def view(self, topic):
+        return self.views[topic]
+
+class TopicModel:
+    '''
+    Wraps the unified network so it is called like a single topic model
+    - appends the topic indicator to each bag of words
+    - returns only the topic's block of outputs, renormalised to sum to 1
+    '''
+
+    def __init__(self, model, topic_position, topic_count, class_slice):
+        self.model = model
+        self.topic_position = topic_position
+        self.topic_count = topic_count
+        self.class_slice = class_slice
+
+    def __call__(self, bags_of_words, training=False):
+        bags_of_words = numpy.asarray(bags_of_words)
+        topic_columns = numpy.zeros((len(bags_of_words), self.topic_count), dtype=bags_of_words.dtype)
+        topic_columns[:, self.topic_position] = 1
+        predictions = numpy.asarray(self.model(numpy.concatenate([bags_of_words, topic_columns], axis=1), training=training))
+        predictions = predictions[:, self.class_slice]
+        return predictions / predictions.sum(axis=1, keepdims=True)
+
+    def get_weights(self):
+        return []
+
+class TopicView:
+    '''
+    One topic's view of a UnifiedEngine, with the attributes and respond() of a ResponseEngine
+    '''
+
+    def __init__(self, engine, topic, topic_model):
+        self.model_name = topic
+        self.words = engine.words
+        self.word_index = engine.word_index
+        self.word_classes = engine.word_classes[topic]
+        self.tokeniser = engine.tokeniser
+        self.response_table = engine.response_table[topic]
+        self.model = topic_model
+
+    def respond(self, message_text):
+        results = get_probabilities(message_text, self.words, self.model, self.word_index, self.tokeniser)
+        with telemetry.stage('get_response'):
+            class_index = get_class_index(results)
+            return get_indexed_response(class_index, self.response_table)
+
+class EngineCache:
+    '''
+    Bounded LRU cache of ResponseEngines, keyed by topic
+    - budget is a maximum number of topics and/or a maximum number of bytes (None = unbounded)
+    - the most recently used engine is always kept, even if it alone exceeds the byte budget
+    '''
+
+    def __init__(self, max_topics=None, max_bytes=None):
+        self.max_topics = max_topics
+        self.max_bytes = max_bytes
+        self.engines = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, model_name):
+        '''
+        Returns the engine for a topic, loading it on a miss and reloading it if its artifacts changed
+        - in unified mode every topic is a view of the one resident UnifiedEngine
+        '''
+
+        if UNIFIED:
+            return self.get_engine(UNIFIED_NAME).view(model_name)
+        return self.get_engine(model_name)
+
+    def get_engine(self, model_name):
+        '''
+        Returns the cached engine for a model, or loads a new one on a miss or when its artifacts changed
+        - a new engine is loaded outside the lock and swapped in, never reloaded in place,
+          so callers still using the old engine keep a consistent vocabulary and model
+        '''
+
+        with self.lock:
+            engine = self.engines.get(model_name)
+            if engine is not None and not engine.is_stale():
+                self.engines.move_to_end(model_name) # marks as most recently used
+                return engine
+        telemetry.count('engine_cache_misses' if engine is None else 'engine_reloads')
+        new_engine = UnifiedEngine() if model_name == UNIFIED_NAME else ResponseEngine(model_name)
+        with self.lock:
+            current = self.engines.get(model_name)
+            if current is not None and current is not engine: # another thread swapped in its engine first
+                new_engine = current
+            self.engines[model_name] = new_engine
+            self.engines.move_to_end(model_name)
+            self.evict()
+            return new_engine
+
+    def evict(self):
+        '''
+        Drops least recently used engines until the cache is within budget
+        '''
+
+        while len(self.engines) > 1 and self.over_budget():
+            self.engines.popitem(last=False)
+            telemetry.count('engine_evictions')
+
+    def over_budget(self):
+        '''
+        Checks the cache against its topic and byte budgets
+        '''
+
+        if self.max_topics is not None and len(self.engines) > self.max_topics:
+            return True
+        if self.max_bytes is not None and self.total_size() > self.max_bytes:
+            return True
+        return False
+
+    def total_size(self):
+        '''
+        Total estimated size in bytes of all resident engines
+        '''
+
+        return sum(engine.size for engine in self.engines.values())
+
+    def clear(self):
+        '''
+        Unloads every engine
+        '''
+
+        with self.lock:
+            self.engines.clear()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Background Inference Class
+
+class ResponseWorker:
+    '''
+    Runs responses_main() on a background thread so a frame loop never blocks on inference
+    - submit() queues a (topic, message) request and returns its id immediately
+    - poll() returns any finished (request id, response, error) results without blocking
+    '''
+
+    def __init__(self):
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.next_id = 0
+        self.thread = None
+
+    def submit(self, model_name, message_text):
+        '''
+        Queues a message for a response, starting the worker thread on first use
+        '''
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='kai-response-worker', daemon=True)
+            self.thread.start()
+        request_id = self.next_id
+        self.next_id += 1
+        self.requests.put((request_id, model_name, message_text))
+        return request_id
+
+    def poll(self):
+        '''
+        Returns all finished results, an empty list if none are ready
+        '''
+
+        finished = []
+        while True:
+            try:
+                finished.append(self.results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def run(self):
+        '''
+        Worker thread loop - answers requests in order, passing errors back rather than dying
+        '''
+
+        while True:
+            request_id, model_name, message_text = self.requests.get()
+            try:
+                self.results.put((request_id, responses_main(model_name, message_text), None))
+            except Exception as error:
+                self.results.put((request_id, None, error))
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Warm Up Functions
+
+def warm_up(model_names, timer=None):
+    '''
+    Initialises the NLP stack and loads the given topic engines ahead of the first message
+    - nltk, the WordNet data and (for the keras backend) TensorFlow are all imported here
+    '''
+
+    timer = timer or timing.StartupTimer()
+    with timer.measure('warm up', f'{normalisation.TOKENISER} tokeniser + lemmatiser'):
+        message_clean_up('warming up kai')
+    for model_name in model_names:
+        with timer.measure('warm up', f'{model_name} engine ({BACKEND})'):
+            engine_cache.get(model_name)
+
+def start_warm_up(model_names, timer=None):
+    '''
+    Runs warm_up() on a background daemon thread, only the first call starts a thread
+    - any failure is left to surface again on the first real message
+    '''
+
+    global warm_up_thread
+    if warm_up_thread is None:
+        def target():
+            try:
+                warm_up(model_names, timer)
+            except Exception:
+                return
+            if timer:
+                timer.report_once('warm up complete')
+        warm_up_thread = threading.Thread(target=target, name='kai-warm-up', daemon=True)
+        warm_up_thread.start()
+    return warm_up_thread
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Main Function
 
 def responses_main(model_name, message_text):
     '''
-    Main response function, calls other functions and loads necessary files
+    Main response function, gets the resident engine for the topic (loading it if necessary)
     Returns the ai response
     '''
 
-    # loading files
-    words = pickle.load(open(f'{current_path}/models/{model_name}_words.pkl', 'rb'))
-    word_classes = pickle.load(open(f'{current_path}/models/{model_name}_classes.pkl', 'rb'))
-    model = load_model(f'{current_path}/models/{model_name}_model.h5')
-    corpus = json.loads(open(f'{current_path}/corpora/{model_name}.json').read())
-
-    # returning a response
-    results = get_probabilities(message_text, words, model)
-    class_tag = get_class(results, word_classes)
-    response = get_response(class_tag, corpus)
-    return response
+    telemetry.count('messages')
+    with telemetry.stage('responses_main'):
+        engine = engine_cache.get(model_name)
+        return engine.respond(message_text)
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Globals
 
 current_path = os.getcwd()
-lemmatiser = WordNetLemmatizer()
+warm_up_thread = None
+response_worker = ResponseWorker()
 ERROR_THRESHOLD = 0.1
+MODEL_SUFFIXES = {'keras': '_model.h5', 'numpy': '_weights.npz', 'bundle': '.kai'}
+BACKEND = os.environ.get('KAI_BACKEND', 'keras') # 'numpy' and 'bundle' serve exported weights without TensorFlow
+UNIFIED_NAME = 'unified' # artifact prefix of the single multi-topic model, as in training.py
+UNIFIED = os.environ.get('KAI_UNIFIED') == '1' # serve every topic from the unified model
+MAX_CACHED_TOPICS = 3 # at most 3 of the topic models resident at once
+MAX_CACHED_BYTES = None # optional byte budget, e.g. 64 * 1024 * 1024
+engine_cache = EngineCache(max_topics=MAX_CACHED_TOPICS, max_bytes=MAX_CACHED_BYTES)
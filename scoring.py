@@ -0,0 +1,203 @@
+# Bulk Offline Scoring
+
+'''
+Command line tool for pushing large labelled message files through the trained models
+Streams a JSONL or CSV file of (topic, message[, expected_tag]) rows, groups them by topic
+and classifies each group in large batched forward passes using the resident engines from responses.py
+Writes a prediction per row, then reports per-tag accuracy and throughput
+
+Usage: python scoring.py messages.jsonl --output predictions.jsonl --batch-size 1024
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import responses
+
+# ---------------------------------------------------------------------------------------------------------------------
+# File Functions
+
+def read_rows(input_file):
+    '''
+    Generator that streams rows from a JSONL or CSV file as (line number, topic, message, expected tag) tuples
+    - JSONL rows are objects with 'topic', 'message' and optional 'expected_tag' keys
+    - CSV rows are topic,message[,expected_tag], with an optional header row
+    '''
+
+    if input_file.endswith('.csv'):
+        with open(input_file, newline='', encoding='utf-8') as file:
+            for line_number, row in enumerate(csv.reader(file), 1):
+                if not row or (line_number == 1 and row[0].strip().lower() == 'topic'): # skips blank lines and header
+                    continue
+                expected_tag = row[2] if len(row) > 2 and row[2] else None
+                yield line_number, row[0], row[1], expected_tag
+    else:
+        with open(input_file, encoding='utf-8') as file:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                yield line_number, row['topic'], row['message'], row.get('expected_tag')
+
+class PredictionWriter:
+    '''
+    Writes predictions as they are produced, in JSONL or CSV depending on the output file extension
+    '''
+
+    fields = ['line', 'topic', 'message', 'expected_tag', 'predicted_tag', 'probability']
+
+    def __init__(self, output_file):
+        self.file = open(output_file, 'w', newline='', encoding='utf-8')
+        self.csv_writer = None
+        if output_file.endswith('.csv'):
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=self.fields)
+            self.csv_writer.writeheader()
+
+    def write(self, prediction):
+        if self.csv_writer:
+            self.csv_writer.writerow(prediction)
+        else:
+            self.file.write(json.dumps(prediction) + '\n')
+
+    def close(self):
+        self.file.close()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Scoring Functions
+
+def score_batch(topic, batch, writer, tag_counts):
+    '''
+    Classifies a batch of rows for one topic in a single forward pass
+    Writes each prediction and updates the per-tag (correct, total) counts
+    '''
+
+    engine = responses.engine_cache.get(topic)
+    messages = [row[1] for row in batch]
+    batch_results = responses.get_batch_probabilities(messages, engine.words, engine.model, engine.word_index, engine.tokeniser)
+
+    for (line_number, message, expected_tag), results in zip(batch, batch_results):
+        # no class above the error threshold means there is no prediction
+        if results:
+            predicted_tag = responses.get_class(results, engine.word_classes)
+            probability = float(results[0][1]) # get_class sorts highest first
+        else:
+            predicted_tag = None
+            probability = 0.0
+        writer.write({
+            'line': line_number,
+            'topic': topic,
+            'message': message,
+            'expected_tag': expected_tag,
+            'predicted_tag': predicted_tag,
+            'probability': round(probability, 6)
+        })
+
+        if expected_tag is not None:
+            counts = tag_counts.setdefault((topic, expected_tag), [0, 0])
+            counts[0] += int(predicted_tag == expected_tag)
+            counts[1] += 1
+
+def score_file(input_file, output_file, batch_size):
+    '''
+    Streams the input file, buffering rows per topic and flushing each buffer once it holds a full batch
+    Memory use is bounded by batch size * number of topics, not by file size
+    Returns the per-tag counts, the number of rows scored and the elapsed time
+    '''
+
+    pending = {} # topic -> list of (line number, message, expected tag)
+    tag_counts = {}
+    rows_scored = 0
+    writer = PredictionWriter(output_file)
+    start_time = time.perf_counter()
+
+    try:
+        for line_number, topic, message, expected_tag in read_rows(input_file):
+            batch = pending.setdefault(topic, [])
+            batch.append((line_number, message, expected_tag))
+            if len(batch) >= batch_size:
+                score_batch(topic, batch, writer, tag_counts)
+                rows_scored += len(batch)
+                pending[topic] = []
+
+        # flushing partially filled batches
+        for topic, batch in pending.items():
+            if batch:
+                score_batch(topic, batch, writer, tag_counts)
+                rows_scored += len(batch)
+    finally:
+        writer.close()
+    return tag_counts, rows_scored, time.perf_counter() - start_time
+
+def build_report(tag_counts, rows_scored, elapsed):
+    '''
+    Creates the summary report - accuracy per (topic, tag), overall accuracy and throughput
+    '''
+
+    per_tag = [
+        {'topic': topic, 'tag': tag, 'correct': correct, 'total': total, 'accuracy': correct / total}
+        for (topic, tag), (correct, total) in sorted(tag_counts.items())
+    ]
+    correct = sum(row['correct'] for row in per_tag)
+    labelled = sum(row['total'] for row in per_tag)
+    return {
+        'rows': rows_scored,
+        'labelled_rows': labelled,
+        'accuracy': correct / labelled if labelled else None,
+        'seconds': elapsed,
+        'messages_per_second': rows_scored / elapsed if elapsed else None,
+        'per_tag': per_tag
+    }
+
+def print_report(report):
+    '''
+    Outputs the report as a table
+    '''
+
+    print(f"{'topic':<12} {'tag':<20} {'correct':>8} {'total':>8} {'accuracy':>9}")
+    for row in report['per_tag']:
+        print(f"{row['topic']:<12} {row['tag']:<20} {row['correct']:>8} {row['total']:>8} {row['accuracy']:>9.2%}")
+    if report['accuracy'] is not None:
+        print(f"overall accuracy: {report['accuracy']:.2%} over {report['labelled_rows']} labelled rows")
+    print(f"{report['rows']} messages in {report['seconds']:.2f}s ({report['messages_per_second'] or 0:.0f} messages/s)")
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def scoring_main(argv=None):
+    '''
+    Parses the command line arguments and scores the given file
+    '''
+
+    parser = argparse.ArgumentParser(description='Score a JSONL/CSV file of (topic, message[, expected_tag]) rows')
+    parser.add_argument('input_file')
+    parser.add_argument('--output', help='predictions file (.jsonl or .csv), defaults to <input>_predictions.jsonl')
+    parser.add_argument('--report', help='optional JSON file to write the accuracy and throughput report to')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    responses.engine_cache.max_topics = None # keeps every topic in the file resident while scoring
+    output_file = args.output or f'{os.path.splitext(args.input_file)[0]}_predictions.jsonl'
+    tag_counts, rows_scored, elapsed = score_file(args.input_file, output_file, args.batch_size)
+    report = build_report(tag_counts, rows_scored, elapsed)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=4)
+    return report
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+DEFAULT_BATCH_SIZE = 1024
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    scoring_main(sys.argv[1:])
@@ -0,0 +1,173 @@
+# Headless Chat Service
+
+'''
+Serves the response engine without the pygame GUI, so kAi can run on any platform and under real load
+Line-delimited JSON over TCP, built on asyncio:
+    request  {"id": 1, "topic": "general", "message": "hello"}
+    response {"id": 1, "topic": "general", "responses": ["Hi im Kai", "Im an AI"]}
+    error    {"id": 1, "error": "timeout"}
+Topic models are preloaded at startup, inference runs on a bounded thread pool
+
+Usage: python server.py --topics general football --port 8765 --concurrency 4 --timeout 2 --backend numpy
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import sys
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import responses
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Server Class
+
+class ChatServer:
+    '''
+    asyncio server answering (topic, message) requests with the resident response engines
+    - concurrency: maximum number of messages being classified at once
+    - timeout: seconds before a request is answered with a timeout error, its inference keeps its slot until it finishes
+    - max_pending: requests allowed in flight or waiting, beyond that new requests are refused with a busy error
+    '''
+
+    def __init__(self, topics, concurrency=4, timeout=2.0, max_pending=256):
+        self.topics = topics
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = 0
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='kai-inference')
+
+    def preload(self):
+        '''
+        Loads every served topic up front so no request pays the model load
+        '''
+
+        responses.engine_cache.max_topics = max(len(self.topics), responses.engine_cache.max_topics or 0)
+        for topic in self.topics:
+            responses.engine_cache.get(topic)
+
+    async def answer(self, request):
+        '''
+        Creates the reply for one decoded request
+        '''
+
+        if not isinstance(request, dict):
+            return {'error': 'request must be a JSON object'}
+        request_id = request.get('id')
+        topic = request.get('topic')
+        message = request.get('message')
+        if topic not in self.topics or not isinstance(message, str):
+            return {'id': request_id, 'error': 'request needs a served topic and a message string'}
+
+        # backpressure - refuse rather than queue without limit
+        if self.pending >= self.max_pending:
+            return {'id': request_id, 'error': 'busy'}
+        self.pending += 1
+        try:
+            await self.semaphore.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+        # the slot is held until the inference thread finishes, not until the reply, so timed out work still counts
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, responses.responses_main, topic, message)
+        future.add_done_callback(self.finished)
+        try:
+            ai_response = await asyncio.wait_for(asyncio.shield(future), self.timeout) # shielded, a timeout leaves the future running
+        except asyncio.TimeoutError:
+            return {'id': request_id, 'error': 'timeout'}
+        except Exception as error:
+            return {'id': request_id, 'error': f'{type(error).__name__}: {error}'}
+
+        # multi-bubble responses are already lists, single responses are wrapped so clients see one shape
+        if type(ai_response) != list:
+            ai_response = [ai_response]
+        return {'id': request_id, 'topic': topic, 'responses': ai_response}
+
+    def finished(self, future):
+        '''
+        Frees a request's pending and concurrency slots once its inference has finished, including after a timeout
+        '''
+
+        self.pending -= 1
+        self.semaphore.release()
+        if not future.cancelled():
+            future.exception() # marks the error as retrieved, a timed out request has no other reader
+
+    async def handle_client(self, reader, writer):
+        '''
+        Answers each line from a client in order until the client disconnects
+        '''
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    reply = await self.answer(request)
+                except ValueError:
+                    reply = {'error': 'invalid JSON'}
+                writer.write((json.dumps(reply) + '\n').encode('utf-8'))
+                await writer.drain() # stops reading more requests from clients that are not reading replies
+        except (ConnectionError, ValueError): # disconnected, or a line over MAX_LINE_BYTES
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        '''
+        Preloads the topics and serves until cancelled
+        '''
+
+        self.preload()
+        server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE_BYTES)
+        print(f"kAi serving {', '.join(self.topics)} on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def server_main(argv=None):
+    '''
+    Parses the command line arguments and runs the server
+    '''
+
+    parser = argparse.ArgumentParser(description='Headless line-delimited JSON chat service for kAi')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--topics', nargs='+', default=['general', 'football'])
+    parser.add_argument('--concurrency', type=int, default=4, help='messages classified at once')
+    parser.add_argument('--timeout', type=float, default=2.0, help='seconds per request')
+    parser.add_argument('--max-pending', type=int, default=256, help='requests in flight before refusing with busy')
+    parser.add_argument('--backend', choices=list(responses.MODEL_SUFFIXES), default=responses.BACKEND)
+    args = parser.parse_args(argv)
+
+    responses.set_backend(args.backend)
+
+    async def run():
+        chat_server = ChatServer(args.topics, args.concurrency, args.timeout, args.max_pending)
+        await chat_server.serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_LINE_BYTES = 64 * 1024 # longest accepted request line
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    server_main(sys.argv[1:])
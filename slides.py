@@ -0,0 +1,123 @@
+# User Manual Slides
+
+'''
+Decoded, display-ready cache of the user manual slides used by graphics.um_main()
+Each slide is decoded from disk once, the next slide is decoded ahead of time on a background thread
+Slides can also be stored as compressed PNG copies to save storage space: python slides.py [--delete-originals]
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Slide Functions
+
+def find_slides(directory):
+    '''
+    Gets the path of every slide in name order, using the compressed copy of a slide when one exists
+    '''
+
+    slides = {}
+    for file in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file)
+        if extension not in SLIDE_EXTENSIONS:
+            continue
+        current = slides.get(name)
+        if current is None or SLIDE_EXTENSIONS.index(extension) < SLIDE_EXTENSIONS.index(os.path.splitext(current)[1]):
+            slides[name] = file
+    return [f'{directory}/{slides[name]}' for name in sorted(slides)]
+
+def compress_slides(directory, delete_originals=False):
+    '''
+    Saves a losslessly compressed PNG copy of every TIFF slide, optionally deleting the TIFFs
+    Returns the total bytes before and after
+    '''
+
+    before = 0
+    after = 0
+    for file in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(file)
+        if extension != '.tif':
+            continue
+        tif_path = f'{directory}/{file}'
+        png_path = f'{directory}/{name}.png'
+        pygame.image.save(pygame.image.load(tif_path), png_path)
+        before += os.path.getsize(tif_path)
+        after += os.path.getsize(png_path)
+        if delete_originals:
+            os.remove(tif_path)
+    return before, after
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Slide Cache Class
+
+class SlideCache:
+    '''
+    Small LRU cache of slides converted to the display format
+    - decoding (disk read + image decode) runs on a background thread, ahead of when a slide is needed
+    - convert() runs on the main thread as it needs the display, once per slide
+    '''
+
+    def __init__(self, paths, max_slides=3):
+        self.paths = paths
+        self.max_slides = max_slides
+        self.converted = OrderedDict() # slide index -> display format surface
+        self.decoding = {} # slide index -> future of the decoded surface
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kai-slides')
+
+    def __len__(self):
+        return len(self.paths)
+
+    def get(self, index):
+        '''
+        Returns slide index ready to blit, then starts decoding the slide after it
+        '''
+
+        surface = self.converted.get(index)
+        if surface is None:
+            self.prefetch(index)
+            surface = self.decoding.pop(index).result().convert() # waits only if the prefetch has not finished
+            self.converted[index] = surface
+            if len(self.converted) > self.max_slides:
+                self.converted.popitem(last=False)
+        self.converted.move_to_end(index)
+        self.prefetch((index + 1) % len(self.paths))
+        return surface
+
+    def prefetch(self, index):
+        '''
+        Starts decoding a slide in the background if it is not already cached or decoding
+        '''
+
+        if index not in self.converted and index not in self.decoding:
+            self.decoding[index] = self.executor.submit(pygame.image.load, self.paths[index])
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Main Function
+
+def slides_main(argv):
+    '''
+    Compresses the user manual slides
+    '''
+
+    before, after = compress_slides(SLIDES_DIR, delete_originals='--delete-originals' in argv)
+    print(f'slides: {before / 1024:.0f} KB as TIFF, {after / 1024:.0f} KB as PNG')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+current_path = os.getcwd()
+SLIDES_DIR = f'{current_path}/images/user_manual_images'
+SLIDE_EXTENSIONS = ['.png', '.tif'] # preferred first
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Runs File
+
+if __name__ == '__main__':
+    slides_main(sys.argv[1:])
@@ -0,0 +1,209 @@
+# Runtime Telemetry
+
+'''
+Opt-in per-stage latency timers, counters and frame-time histograms
+responses.py times each stage of answering a message (tokenise, lemmatise, bow, model, get_response, engine load),
+graphics.py records the frame time and loop lag of its frame loops and can draw a small overlay of the numbers
+Enabled with KAI_TELEMETRY=1 or --telemetry, the log is written on exit to KAI_TELEMETRY_LOG (.json or .csv)
+When disabled, stage() returns a shared do-nothing context and count() / record() return immediately
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import csv
+import json
+import time
+import atexit
+import threading
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Histogram Class
+
+class Histogram:
+    '''
+    Fixed bucket histogram of durations in milliseconds, constant memory however long the app runs
+    - bucket i counts durations up to BUCKET_BOUNDS_MS[i], the last bucket counts everything slower
+    - keeps the most recent value so the overlay can show what just happened
+    '''
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+
+    def add(self, value_ms):
+        bucket = 0
+        while bucket < len(BUCKET_BOUNDS_MS) and value_ms > BUCKET_BOUNDS_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_ms += value_ms
+        self.max_ms = max(self.max_ms, value_ms)
+        self.last_ms = value_ms
+
+    def percentile(self, fraction):
+        '''
+        Upper bound of the bucket holding the given fraction of values, capped at the maximum seen
+        '''
+
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target and bucket_count:
+                return min(BUCKET_BOUNDS_MS[bucket], self.max_ms) if bucket < len(BUCKET_BOUNDS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.50),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max_ms,
+            'last_ms': self.last_ms,
+            'buckets': dict(zip([f'<={bound}' for bound in BUCKET_BOUNDS_MS] + ['slower'], self.counts))
+        }
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Telemetry Classes
+
+class Stage:
+    '''
+    Context manager timing one stage into its histogram
+    '''
+
+    __slots__ = ('telemetry', 'name', 'start')
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.telemetry.record(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+class NullStage:
+    '''
+    Shared context used for every stage while telemetry is disabled
+    '''
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+class Telemetry:
+    '''
+    Named histograms and counters, thread safe as responses are computed on the worker thread
+    - stage(name): with telemetry.stage('model'): times the block
+    - record(name, value_ms): adds an already measured duration, e.g. a frame time
+    - count(name, amount): increments a counter
+    '''
+
+    def __init__(self, enabled=False, log_path=None):
+        self.enabled = enabled
+        self.log_path = log_path
+        self.histograms = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def record(self, name, value_ms):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = Histogram()
+                self.histograms[name] = histogram
+            histogram.add(value_ms)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        '''
+        Summary of every histogram and counter
+        '''
+
+        with self.lock:
+            return {
+                'seconds': time.perf_counter() - self.start,
+                'histograms': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+                'counters': dict(sorted(self.counters.items()))
+            }
+
+    def export(self, path=None):
+        '''
+        Writes the snapshot to path (or log_path), as CSV rows if it ends in .csv, otherwise JSON
+        '''
+
+        path = path or self.log_path
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        snapshot = self.snapshot()
+        if path.endswith('.csv'):
+            fields = ['name', 'kind', 'count', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.DictWriter(file, fieldnames=fields, extrasaction='ignore')
+                writer.writeheader()
+                for name, summary in snapshot['histograms'].items():
+                    writer.writerow(dict(summary, name=name, kind='histogram'))
+                for name, value in snapshot['counters'].items():
+                    writer.writerow({'name': name, 'kind': 'counter', 'count': value})
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(snapshot, file, indent=4)
+
+    def overlay_lines(self, names):
+        '''
+        Short text lines of the given histograms and every counter, for drawing over a screen
+        '''
+
+        lines = []
+        with self.lock:
+            for name in names:
+                histogram = self.histograms.get(name)
+                if histogram is not None:
+                    lines.append(f'{name} {histogram.last_ms:.1f}ms p95 {histogram.percentile(0.95):.1f} max {histogram.max_ms:.0f}')
+            lines.extend(f'{name} {value}' for name, value in sorted(self.counters.items()))
+        return lines
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+BUCKET_BOUNDS_MS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 50, 100, 250, 500, 1000, 5000]
+NULL_STAGE = NullStage()
+telemetry = Telemetry(
+    enabled=os.environ.get('KAI_TELEMETRY') == '1' or '--telemetry' in sys.argv,
+    log_path=os.environ.get('KAI_TELEMETRY_LOG', f'{os.getcwd()}/logs/telemetry.json')
+)
+if telemetry.enabled:
+    atexit.register(telemetry.export)
@@ -0,0 +1,10 @@
+# Test Configuration
+
+'''
+Makes the flat kAi modules importable from tests/, run the tests from the repository root: python -m pytest
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
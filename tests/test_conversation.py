@@ -0,0 +1,28 @@
+# Conversation Store Tests
+
+import conversation
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+def test_append_past_partially_read_page(tmp_path):
+    store = conversation.ConversationStore(str(tmp_path / 'chat'), window=2, page_size=8)
+    for i in range(5):
+        store.append([i % 2, [f'message {i}'], '00:00'])
+    assert store.get(0) == [0, ['message 0'], '00:00'] # reads the partial first page from disk
+
+    for i in range(5, 20):
+        store.append([i % 2, [f'message {i}'], '00:00'])
+    assert [entry[1][0] for entry in store.newest_first()] == [f'message {i}' for i in reversed(range(20))]
+    store.close()
+
+def test_reopen_restores_window(tmp_path):
+    store = conversation.ConversationStore(str(tmp_path / 'chat'), window=3, page_size=4)
+    for i in range(10):
+        store.append([2, f'topic {i}', '00:00'])
+    store.close()
+
+    store = conversation.ConversationStore(str(tmp_path / 'chat'), window=3, page_size=4)
+    assert len(store) == 10
+    assert [store.get(i)[1] for i in range(10)] == [f'topic {i}' for i in range(10)]
+    store.close()
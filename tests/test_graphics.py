@@ -0,0 +1,28 @@
+# Graphics Tests
+
+import os
+import pytest
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+graphics = pytest.importorskip('graphics') # needs pygame, and the win32 modules the window setup uses
+pygame = graphics.pygame
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+@pytest.mark.parametrize('background, position, rects', [
+    ('MENU_BG_IMAGE', (354, 0), [(pygame.Rect(891, 7, 24, 24), 0)] + [(pygame.Rect(542, y, 192, 58), 0) for y in (366, 454, 541, 628)]),
+    ('CW_BG_IMAGE', (0, 0), [(pygame.Rect(275, 625, 875, 50), 0)] + [(pygame.Rect(49, 87 + 66 * i, 143, 46), 4) for i in range(9)])
+])
+def test_static_layer_matches_per_frame_drawing(background, position, rects):
+    background = getattr(graphics, background)
+    layer = graphics.build_static_layer(background, position)
+
+    # what each frame drew before the layer: colour key fill, background, then the alpha 0 click boxes
+    frame = pygame.Surface((graphics.SCREEN_WIDTH, graphics.SCREEN_HEIGHT)).convert()
+    frame.fill(graphics.TRANSPARENT)
+    frame.blit(background, position)
+    for rect, radius in rects:
+        graphics.draw_rect_transparent(frame, (0, 0, 0, 0), rect, radius)
+
+    assert pygame.image.tobytes(layer, 'RGB') == pygame.image.tobytes(frame, 'RGB')
@@ -0,0 +1,72 @@
+# Normalisation Tests
+
+import os
+import json
+import pickle
+import pytest
+import normalisation
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+def test_loaded_cache_trimmed_to_max_size(tmp_path):
+    cache_path = tmp_path / 'lemma_cache.json'
+    with open(cache_path, 'w', encoding='utf-8') as file:
+        json.dump({f'token{i}': f'lemma{i}' for i in range(10)}, file)
+
+    normaliser = normalisation.Normaliser(max_size=4, cache_path=str(cache_path))
+    normaliser.load()
+
+    assert list(normaliser.cache) == ['token6', 'token7', 'token8', 'token9'] # least recently used dropped first
+
+@pytest.mark.parametrize('text', [
+    '', 'hello', 'hi   there', 'tab\tseparated', "don't do that", "I'm gonna go", 'cannot stop', 'wanna play?',
+    "I've, you'll, he'd, they're", "'tis the season", "football's the best sport", 'Mr. Smith went to the U.S. today.',
+    'Dr. Who? Yes. No!', 'Wait... what?!', 'hi!! how are you??', 'It costs $20.50, right?', "it's 3.5 or 4,000",
+    '"quoted" text', "She said 'no'.", '(brackets) and [more]', 'e-mail me at a@b.com', 'café naïve', 'end.Start'
+])
+def test_fast_tokeniser_edge_cases(text):
+    assert normalisation.fast_tokenise(text) == treebank_tokens(text)
+
+def test_fast_tokeniser_corpus_patterns(monkeypatch):
+    monkeypatch.setattr(normalisation, 'current_path', REPOSITORY)
+    texts = normalisation.corpus_texts()
+
+    assert texts
+    assert [text for text in texts if normalisation.fast_tokenise(text) != treebank_tokens(text)] == []
+
+def test_fast_tokeniser_matches_punkt(monkeypatch):
+    nltk = pytest.importorskip('nltk')
+    try:
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        pytest.skip('NLTK punkt data is not installed')
+    monkeypatch.setattr(normalisation, 'current_path', REPOSITORY)
+
+    assert [text for text in normalisation.corpus_texts() if normalisation.fast_tokenise(text) != normalisation.nltk_tokenise(text)] == []
+
+def test_words_file_records_tokeniser(tmp_path, monkeypatch):
+    monkeypatch.setattr(normalisation, 'current_path', str(tmp_path)) # no build manifest to fall back on
+    normalisation.save_words(['hello', 'world'], tmp_path / 'topic_words.pkl', 'fast')
+    with open(tmp_path / 'old_words.pkl', 'wb') as file:
+        pickle.dump(['hello', 'world'], file)
+
+    assert normalisation.load_words(tmp_path / 'topic_words.pkl', 'topic') == (['hello', 'world'], 'fast')
+    assert normalisation.load_words(tmp_path / 'old_words.pkl', 'old') == (['hello', 'world'], 'nltk')
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Helper Functions
+
+def treebank_tokens(text):
+    '''
+    nltk.word_tokenize with the same sentence split as the fast tokeniser, the Treebank rules must match exactly
+    - punkt is only approximated by split_sentences() and its data is not needed here
+    '''
+
+    from nltk.tokenize import NLTKWordTokenizer
+    return [token for sentence in normalisation.split_sentences(text) for token in NLTKWordTokenizer().tokenize(sentence)]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,69 @@
+# NumPy Backend Tests
+
+import numpy
+import pytest
+import bundle
+import compression
+import numpy_backend
+import training
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Fixtures
+
+@pytest.fixture(scope='module')
+def trained_model():
+    '''
+    Small keras model with the training architecture, fitted briefly on random bags of words
+    '''
+
+    pytest.importorskip('keras')
+    rng = numpy.random.default_rng(0)
+    inputs = (rng.random((200, WORD_COUNT)) < 0.1).astype(numpy.float32)
+    outputs = numpy.eye(CLASS_COUNT, dtype=numpy.float32)[rng.integers(0, CLASS_COUNT, 200)]
+    model = training.build_model(WORD_COUNT, CLASS_COUNT)
+    model.fit(inputs, outputs, epochs=5, batch_size=16, verbose=0)
+    return model
+
+@pytest.fixture
+def bags():
+    # sparse binary rows like real messages, plus an empty message
+    rows = (numpy.random.default_rng(1).random((64, WORD_COUNT)) < 0.05).astype(int)
+    rows[0] = 0
+    return rows
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+def test_numpy_and_bundle_match_keras(trained_model, bags, tmp_path):
+    expected = trained_model.predict(bags, verbose=0)
+    numpy_backend.export_model(trained_model, tmp_path / 'topic_weights.npz')
+    numpy_model = numpy_backend.load_numpy_model(tmp_path / 'topic_weights.npz')
+    bundle.write_bundle(str(tmp_path / 'topic.kai'), WORDS, CLASSES, TABLE, numpy_model.layers)
+
+    assert numpy.abs(numpy_model(bags) - expected).max() < 1e-5
+    assert numpy.abs(numpy.asarray(bundle.load_bundle(str(tmp_path / 'topic.kai')).model(bags)) - expected).max() < 1e-5
+
+@pytest.mark.parametrize('precision, tolerance', [('float16', 1e-3), ('int8', 1e-2)])
+def test_compressed_bundle_matches_keras(trained_model, bags, tmp_path, precision, tolerance):
+    expected = trained_model.predict(bags, verbose=0)
+    numpy_backend.export_model(trained_model, tmp_path / 'topic_weights.npz')
+    layers, scales = compression.compress_layers(numpy_backend.load_numpy_model(tmp_path / 'topic_weights.npz').layers, precision)
+    bundle.write_bundle(str(tmp_path / 'topic.kai'), WORDS, CLASSES, TABLE, layers, {'precision': precision}, scales)
+    loaded = bundle.load_bundle(str(tmp_path / 'topic.kai'))
+    assert loaded.model.layers[0][0].dtype != numpy.float32 # first layer is served by gather_product()
+
+    # gather_product() must give what a float32 copy of the dequantised weights gives
+    dequantised = [(kernel.astype(numpy.float32) * numpy.float32(scales[i] if scales else 1.0), bias, activation) for i, (kernel, bias, activation) in enumerate(layers)]
+    actual = numpy.asarray(loaded.model(bags))
+    assert numpy.abs(actual - numpy_backend.NumpyModel(dequantised)(bags)).max() < 1e-5
+    assert numpy.abs(actual - expected).max() < tolerance
+    assert (actual.argmax(axis=1) == expected.argmax(axis=1)).mean() > 0.9
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+WORD_COUNT = 300
+CLASS_COUNT = 6
+WORDS = [f'word{i}' for i in range(WORD_COUNT)]
+CLASSES = [f'class{i}' for i in range(CLASS_COUNT)]
+TABLE = [[f'response {i}'] for i in range(CLASS_COUNT)]
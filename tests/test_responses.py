@@ -0,0 +1,112 @@
+# Response Engine Tests
+
+import os
+import time
+import json
+import pickle
+import threading
+import numpy
+import pytest
+import corpus_stream
+import normalisation
+import responses
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Fixtures
+
+@pytest.fixture
+def models(tmp_path, monkeypatch):
+    '''
+    Empty models/ directory served with the numpy backend by a fresh engine cache
+    '''
+
+    (tmp_path / 'models').mkdir()
+    monkeypatch.setattr(responses, 'current_path', str(tmp_path))
+    monkeypatch.setattr(responses, 'BACKEND', 'numpy')
+    monkeypatch.setattr(responses, 'UNIFIED', False)
+    monkeypatch.setattr(responses, 'engine_cache', responses.EngineCache(max_topics=3))
+    return tmp_path / 'models'
+
+def write_topic(models, model_name, words, mtime):
+    '''
+    Writes numpy backend artifacts for a topic with a one layer model over words, all with the given modification time
+    '''
+
+    word_classes = ['greeting', 'goodbye']
+    paths = [models / f'{model_name}_words.pkl', models / f'{model_name}_classes.pkl', models / f'{model_name}_responses.json', models / f'{model_name}_weights.npz']
+    with open(paths[0], 'wb') as file:
+        pickle.dump(words, file)
+    with open(paths[1], 'wb') as file:
+        pickle.dump(word_classes, file)
+    with open(paths[2], 'w', encoding='utf-8') as file:
+        json.dump([['hi'], ['bye']], file)
+    with open(paths[3], 'wb') as file:
+        numpy.savez(file, kernel_0=numpy.ones((len(words), len(word_classes)), dtype=numpy.float32), bias_0=numpy.zeros(len(word_classes), dtype=numpy.float32), activation_0=numpy.array('softmax'))
+    for path in paths:
+        os.utime(path, (mtime, mtime))
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+def test_reload_while_responding(models, monkeypatch):
+    load_topic_model = responses.load_topic_model
+    def slow_load_topic_model(path): # widens the window between loading the vocabulary and the model
+        time.sleep(0.02)
+        return load_topic_model(path)
+    monkeypatch.setattr(responses, 'load_topic_model', slow_load_topic_model)
+
+    write_topic(models, 'topic', ['hello', 'bye'], 1000)
+    responses.engine_cache.get('topic')
+    errors = []
+    stop = threading.Event()
+    def respond():
+        while not stop.is_set():
+            try:
+                responses.engine_cache.engines['topic'].respond('hello there')
+            except Exception as error:
+                errors.append(error)
+
+    thread = threading.Thread(target=respond)
+    thread.start()
+    try:
+        for version in range(1, 11): # each retrain changes the vocabulary size, and so the model's input size
+            write_topic(models, 'topic', ['hello', 'bye'] + [f'word{i}' for i in range(version)], 1000 + version)
+            engine = responses.engine_cache.get('topic')
+            assert len(engine.words) == version + 2
+    finally:
+        stop.set()
+        thread.join()
+    assert errors == []
+
+def test_size_includes_dense_kernels(models):
+    write_topic(models, 'topic', ['hello', 'bye'], 1000)
+    with open(models / 'topic_weights.npz', 'wb') as file: # two float16 layers, the second is kept as float32 too
+        numpy.savez(file, kernel_0=numpy.ones((2, 8), dtype=numpy.float16), bias_0=numpy.zeros(8, dtype=numpy.float32), activation_0=numpy.array('relu'),
+                    kernel_1=numpy.ones((8, 2), dtype=numpy.float16), bias_1=numpy.zeros(2, dtype=numpy.float32), activation_1=numpy.array('softmax'))
+
+    engine = responses.engine_cache.get('topic')
+
+    other_size = sum(os.path.getsize(models / f'topic{suffix}') for suffix in ['_words.pkl', '_classes.pkl', '_responses.json'])
+    assert engine.size == (2 * 8 * 2 + 8 * 4) + (8 * 2 * 2 + 2 * 4) + 8 * 2 * 4 + other_size
+
+def test_bow_encode_matches_bow():
+    topics = [file[:-len('_words.pkl')] for file in sorted(os.listdir(os.path.join(REPOSITORY, 'models'))) if file.endswith('_words.pkl')]
+    assert topics
+    for topic in topics:
+        words, tokeniser = normalisation.load_words(os.path.join(REPOSITORY, 'models', f'{topic}_words.pkl'), topic)
+        patterns = [pattern for pattern, tag in corpus_stream.read_patterns(os.path.join(REPOSITORY, 'corpora', f'{topic}.json'))]
+        # words outside the vocabulary, and words repeated within a message
+        messages = patterns + [f'{pattern} qwertyuiop {pattern}' for pattern in patterns] + ['', 'qwertyuiop asdfghjkl', f'{words[-1]} {words[-1]} {words[1]}']
+        word_index = responses.bow_index(words)
+
+        bags = responses.bow_encode(messages, word_index)
+        for message_text, row in zip(messages, bags):
+            expected = responses.bow(message_text, words)
+            single = responses.bow_encode(message_text, word_index)
+            assert single.dtype == expected.dtype and row.dtype == expected.dtype
+            assert numpy.array_equal(single, expected) and numpy.array_equal(row, expected), (topic, message_text)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
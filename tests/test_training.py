@@ -0,0 +1,115 @@
+# Training Tests
+
+import os
+import json
+import pickle
+import shutil
+import pytest
+import corpus_stream
+import response_table
+import training
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Fixtures
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    '''
+    Empty corpora/ and models/ directories as the working directory, with a short training run
+    '''
+
+    (tmp_path / 'corpora').mkdir()
+    (tmp_path / 'models').mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(training, 'current_path', str(tmp_path))
+    monkeypatch.setitem(training.HYPERPARAMETERS, 'epochs', 2)
+    return tmp_path
+
+def repository_corpus(name):
+    with open(os.path.join(REPOSITORY, 'corpora', f'{name}.json'), encoding='utf-8') as file:
+        return json.load(file)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Tests
+
+def test_unified_model_from_sharded_corpus(workspace):
+    general = repository_corpus('general')
+    corpus_stream.write_shards(general['intents'], str(workspace / 'corpora' / 'general'), shard_lines=2, line_patterns=2)
+    shutil.copy(os.path.join(REPOSITORY, 'corpora', 'football.json'), workspace / 'corpora' / 'football.json')
+
+    training.create_unified_model(['general', 'football.json'])
+
+    with open(workspace / 'models' / f'{training.UNIFIED_NAME}_classes.pkl', 'rb') as file:
+        topic_classes = pickle.load(file)
+    tables = response_table.load_response_table(str(workspace / 'models' / f'{training.UNIFIED_NAME}_responses.json'))
+    expected_responses = response_table.corpus_responses(general)
+    assert topic_classes['general'] == sorted(expected_responses)
+    assert tables['general'] == [expected_responses[tag] for tag in topic_classes['general']]
+    assert os.path.exists(workspace / 'models' / f'{training.UNIFIED_NAME}_weights.npz')
+
+def test_sharded_corpus_without_responses(workspace):
+    intents = [{'tag': 'greetings', 'patterns': ['hello', 'hi']}]
+    corpus_stream.write_shards(intents, str(workspace / 'corpora' / 'broken'))
+
+    with pytest.raises(ValueError, match='no responses for greetings'):
+        training.create_unified_model(['broken'])
+
+def test_unified_model_retrained_when_topics_renamed(workspace, monkeypatch):
+    trained = []
+    monkeypatch.setattr(training, 'train_unified', lambda corpus_files: trained.append(corpus_files) or {'topic': training.UNIFIED_NAME, 'seconds': 0.0, 'accuracy': 1.0, 'log': ''})
+    monkeypatch.setattr(training, 'save_lemmas', lambda results: None)
+    monkeypatch.setattr(training, 'save_manifest', lambda manifest: None)
+    monkeypatch.setattr(training, 'artifacts_exist', lambda corpus_name: True)
+    for name, source in [('first', 'general'), ('second', 'football')]:
+        shutil.copy(os.path.join(REPOSITORY, 'corpora', f'{source}.json'), workspace / 'corpora' / f'{name}.json')
+    manifest = {'topics': {}}
+
+    training.unified_main(manifest, ['first.json', 'second.json'], False, None)
+    training.unified_main(manifest, ['first.json', 'second.json'], False, None)
+    assert len(trained) == 1
+
+    # same contents under swapped topic names
+    os.rename(workspace / 'corpora' / 'first.json', workspace / 'corpora' / 'swap.json')
+    os.rename(workspace / 'corpora' / 'second.json', workspace / 'corpora' / 'first.json')
+    os.rename(workspace / 'corpora' / 'swap.json', workspace / 'corpora' / 'second.json')
+    training.unified_main(manifest, ['first.json', 'second.json'], False, None)
+    assert len(trained) == 2
+
+def test_streamed_and_in_memory_vocabulary_match(workspace):
+    intents = repository_corpus('general')['intents'] + [{'tag': 'unused', 'patterns': [], 'responses': ['never given']}]
+    corpus_stream.write_shards(intents, str(workspace / 'corpora' / 'general'), shard_lines=3, line_patterns=2)
+
+    vocabulary, streamed_classes, streamed_responses = training.stream_vocabulary(str(workspace / 'corpora' / 'general'))
+    words, word_classes, docs, tag_responses = training.read_corpus('general')
+
+    assert sorted(streamed_classes) == sorted(word_classes)
+    assert 'unused' not in streamed_classes
+    assert vocabulary == set(training.normaliser.normalise_all([word for word in words if word not in training.ignore_chrs]))
+
+def test_plan_build_shares_streamed_corpus_and_removes_deleted(workspace, monkeypatch):
+    for name in ['first', 'second']:
+        with open(workspace / 'corpora' / f'{name}.jsonl', 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'tag': 'greetings', 'patterns': ['hello'], 'responses': ['hi']}) + '\n')
+    monkeypatch.setattr(training, 'corpora', ['first.jsonl', 'second.jsonl'])
+    for name in ['first', 'deleted']:
+        for suffix in training.ARTIFACT_SUFFIXES:
+            (workspace / 'models' / f'{name}{suffix}').touch()
+    manifest = {'topics': {'first': {'hash': training.corpus_hash('first.jsonl')}, 'deleted': {'hash': 'old'}}}
+
+    to_train, to_share, up_to_date, hashes = training.plan_build(manifest, ['second.jsonl'], False)
+
+    assert (to_train, to_share) == ([], {'second.jsonl': 'first.jsonl'})
+    assert sorted(manifest['topics']) == ['first']
+    assert not any(name.startswith('deleted') for name in os.listdir(workspace / 'models'))
+
+def test_only_rejects_unknown_topics(monkeypatch, capsys):
+    monkeypatch.setattr(training, 'corpora', ['general.json', 'football.json'])
+
+    with pytest.raises(SystemExit):
+        training.training_main(['--only', 'general', '--only', 'footbal'])
+    assert 'unknown topic footbal, valid topics are general, football' in capsys.readouterr().err
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Globals
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
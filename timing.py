@@ -0,0 +1,80 @@
+# Startup Timing
+
+'''
+Records how long each import and asset load takes during application startup
+Used by graphics.py (and the responses warm up) to report where startup time goes
+Report is printed when KAI_STARTUP_REPORT=1 is set or --startup-report is passed
+'''
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Imports
+
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Timer Class
+
+class StartupTimer:
+    '''
+    Collects (category, label, seconds) records, measured relative to process start
+    - thread safe so background warm up can record into the same timer
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.records = []
+        self.lock = threading.Lock()
+        self.enabled = os.environ.get('KAI_STARTUP_REPORT') == '1' or '--startup-report' in sys.argv
+        self.milestones = set()
+
+    @contextmanager
+    def measure(self, category, label):
+        '''
+        Times the enclosed block, e.g. with timer.measure('asset', 'MENU_BG_IMAGE'):
+        '''
+
+        block_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, label, time.perf_counter() - block_start)
+
+    def record(self, category, label, seconds):
+        with self.lock:
+            self.records.append((category, label, seconds))
+
+    def elapsed(self):
+        '''
+        Seconds since the timer was created
+        '''
+
+        return time.perf_counter() - self.start
+
+    def report(self):
+        '''
+        Creates the report table, slowest first within each category
+        '''
+
+        with self.lock:
+            records = sorted(self.records, key=lambda x: (x[0], -x[2]))
+        lines = [f"{'category':<10} {'item':<36} {'ms':>9}"]
+        for category, label, seconds in records:
+            lines.append(f'{category:<10} {label:<36} {seconds * 1000:>9.1f}')
+        lines.append(f"{'total':<10} {'since start':<36} {self.elapsed() * 1000:>9.1f}")
+        return '\n'.join(lines)
+
+    def report_once(self, label):
+        '''
+        Records a milestone (e.g. first frame painted) and prints the report the first time it is reached, if enabled
+        '''
+
+        if label in self.milestones:
+            return
+        self.milestones.add(label)
+        self.record('milestone', label, self.elapsed())
+        if self.enabled:
+            print(self.report())
@@ -2,22 +2,39 @@
 
 '''
 Creates the models based on the corpora
-Runs only if models don't exist
+Only retrains corpora whose content or hyperparameters changed since the last build, tracked in models/manifest.json
+Identical corpora share one set of artifacts
+Line-delimited corpora (corpora/{topic}.jsonl or a directory of .jsonl shards, see corpus_stream.py) are streamed:
+the vocabulary is built and the patterns encoded a chunk at a time, and training reads batches from the encoded rows on disk
+--unified instead trains one topic-conditioned model with a shared vocabulary for every corpus
+--precision and --sparsity compress the served bundles (compression.py), changing them does not retrain
+
+Usage: python training.py [--force] [--only TOPIC ...] [--workers N] [--threads N] [--unified] [--precision int8] [--sparsity 0.25]
 '''
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Imports
 
 import os
+import sys
+import time
 import pickle
-import random
 import json
+import shutil
+import hashlib
+import tempfile
+import argparse
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy
-import nltk
-from nltk.stem import WordNetLemmatizer
-from keras.models import Sequential
-from keras.layers import Dense, Dropout
-from keras.optimizers import SGD
+import normalisation
+import bundle
+import compression
+import corpus_stream
+import numpy_backend
+import response_table
+from normalisation import normaliser
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Model Creation Functions
@@ -26,113 +43,698 @@ def create_training_data(word_set, word_classes_set, documents, corpus_name):
     '''
     Creates an array of data from a corpus, that matches the input data against the expected output
     - this is used to determine how well the model is working, and to form and optimise the loss function
+    - builds dense uint8 input and float32 one-hot output matrices directly, in time linear in the number of tokens
     '''
 
-    training_data = []
-    output_layer_empty = [0] * len(word_classes_set) # output layer indicates which class the input belongs to
-    
-    # iterating through each document to create a set of training data
-    for doc in documents:
-        input_data = []
-        doc_words = doc[0]
-        doc_words = [lemmatiser.lemmatize(str(word).lower()) for word in doc_words]
-
-        # matches lemmatised set of words against original tokenised pattern words to create a binary list
-        for word in word_set:
-            if word in doc_words:
-                input_data.append(1)
-            else:
-                input_data.append(0)
-        
-        # correct output is the word class (doc[1]), creates an array of inputs that can be fed into the model
-        output_layer = list(output_layer_empty)
-        output_layer[list(word_classes_set).index(doc[1])] = 1 
-        training_data.append([input_data, output_layer]) 
-    create_model(training_data, corpus_name)
+    word_index = {word: i for i, word in enumerate(word_set)}
+    class_index = {word_class: i for i, word_class in enumerate(word_classes_set)}
+    input_train, output_train = create_training_matrices(word_index, class_index, documents)
+    return create_model(input_train, output_train, corpus_name)
 
-def create_model(training_data_arr, corpus_name):
+def create_training_matrices(word_index, class_index, documents):
+    '''
+    Fills the input and one-hot output matrices for a list of documents
+    - word_index and class_index map each vocabulary word and class to its column
+    '''
+
+    input_train = numpy.zeros((len(documents), len(word_index)), dtype=numpy.uint8)
+    output_train = numpy.zeros((len(documents), len(class_index)), dtype=numpy.float32) # output layer indicates which class the input belongs to
+
+    # iterating through each document to fill its row of training data
+    for row, doc in enumerate(documents):
+        doc_words = normaliser.normalise_all(doc[0])
+
+        # marks the position of each lemmatised pattern word that is in the vocabulary
+        input_train[row, [word_index[word] for word in doc_words if word in word_index]] = 1
+
+        # correct output is the word class (doc[1])
+        output_train[row, class_index[doc[1]]] = 1
+    return input_train, output_train
+
+def create_model(input_train, output_train, corpus_name):
     '''
     Using TensorFlow creates a Seq2Seq model that trains using the data formed in create_training_data()
-    - model has nodes 256-128-128-4 with 0.2 Dropout between each layer
+    - model has nodes 256-128-classes with 0.2 Dropout between each layer
     - utilises Stochastic Gradient Descent, Categorical Crossentropy loss function, ReLU and Softmax functions to get probabilities
     - runs for 200 generations
+    - layer sizes, dropout, optimiser settings and epochs come from HYPERPARAMETERS
+    Saves the keras model and its numpy_backend weights export
+    Returns the final training accuracy
     '''
 
-    # randomising data and converting to numpy array as required by TensorFlow
-    random.shuffle(training_data_arr)
-    training_data_arr = numpy.array(training_data_arr)
-    input_train = list(training_data_arr[:, 0])
-    output_train = list(training_data_arr[:, 1])
+    # randomising the order of the training rows
+    order = numpy.random.permutation(len(input_train))
+    input_train = input_train[order]
+    output_train = output_train[order]
+
+    model = build_model(input_train.shape[1], output_train.shape[1])
+    model_owr = model.fit(input_train, output_train, epochs=HYPERPARAMETERS['epochs'], batch_size=HYPERPARAMETERS['batch_size'], verbose=1)
+    return save_model(model, model_owr, corpus_name)
+
+def create_streamed_model(batches, steps_per_epoch, input_size, class_count, corpus_name):
+    '''
+    create_model() for a corpus too large to hold as matrices, trains from a generator of (inputs, outputs) batches
+    - steps_per_epoch is the number of batches in one pass over the corpus
+    '''
+
+    model = build_model(input_size, class_count)
+    model_owr = model.fit(batches, steps_per_epoch=steps_per_epoch, epochs=HYPERPARAMETERS['epochs'], verbose=1)
+    return save_model(model, model_owr, corpus_name)
+
+def build_model(input_size, class_count):
+    '''
+    Creates and compiles the keras model with the layers and optimiser settings in HYPERPARAMETERS
+    '''
+
+    # keras is only imported once there is a model to train, keeping startup fast
+    from keras.models import Sequential
+    from keras.layers import Dense, Dropout
+    from keras.optimizers import SGD
 
     # creating the model with the specified layers 
+    hidden_layers = HYPERPARAMETERS['hidden_layers']
     model = Sequential()
-    model.add(Dense(256, input_shape=(len(input_train[0]),), activation='relu'))
-    model.add(Dropout(0.2))
-    model.add(Dense(128, input_shape=(1,), activation='relu'))
-    model.add(Dropout(0.2))
-    model.add(Dense(len(output_train[0]), activation='softmax'))
+    model.add(Dense(hidden_layers[0], input_shape=(input_size,), activation='relu'))
+    model.add(Dropout(HYPERPARAMETERS['dropout']))
+    for layer_size in hidden_layers[1:]:
+        model.add(Dense(layer_size, activation='relu'))
+        model.add(Dropout(HYPERPARAMETERS['dropout']))
+    model.add(Dense(class_count, activation='softmax'))
 
     # optimisation and loss function implementation for machine learning
-    sgd = SGD(learning_rate=0.01, momentum=0.5, nesterov=True)
+    sgd = SGD(learning_rate=HYPERPARAMETERS['learning_rate'], momentum=HYPERPARAMETERS['momentum'], nesterov=True)
     model.compile(loss='categorical_crossentropy', optimizer=sgd, weighted_metrics=['accuracy'])
-    model_owr = model.fit(numpy.array(input_train), numpy.array(output_train), epochs=200, batch_size=5, verbose=1)
+    return model
+
+def save_model(model, model_owr, corpus_name):
+    '''
+    Saves the keras model and its numpy_backend weights export, returns the final training accuracy
+    '''
+
     model.save(f'models/{corpus_name}_model.h5', model_owr)
+    numpy_backend.export_model(model, f'models/{corpus_name}_weights.npz')
+    return model_owr.history['accuracy'][-1]
     
 # ---------------------------------------------------------------------------------------------------------------------
 # Data Functions
 
 def get_corpus_data(corpus_file):
+    '''
+    Extracts all the corpus data from a given JSON file, then saves it and trains the topic's model
+    - line-delimited corpora are streamed by stream_corpus_data() instead
+    '''
+
+    if corpus_stream.is_streamed(f'{current_path}/corpora/{corpus_file}'):
+        return stream_corpus_data(corpus_file)
+    words, word_classes, docs, tag_responses = read_corpus(corpus_file)
+    return save_data(words, word_classes, docs, tag_responses, corpus_file)
+
+def read_corpus(corpus_file):
     '''
     Extracts all the corpus data from a given JSON file and stores them in lists
-    - gets pattern words, class tag names and documents (word-class pairs)
+    - gets pattern words, class tag names, documents (word-class pairs) and the response pool of each class
+    '''
+
+    corpus = corpus_stream.load_corpus(f'{current_path}/corpora/{corpus_file}') # reading the given corpus, turns it into a python dictionary
+    return corpus_documents(corpus)
+
+def corpus_documents(corpus):
+    '''
+    Extracts the lists read_corpus() returns from an already parsed corpus dictionary
     '''
 
     words = []
-    word_classes = []
+    word_classes = {} # insertion ordered set, a membership test per pattern is O(1)
     docs = []
-    corpus = json.loads(open(f'{current_path}/corpora/{corpus_file}').read()) # reading the given corpus, turns it into a python dictionary
 
     # loops through each word class and obtains data
     for intent in corpus['intents']:
-        for pattern in intent['patterns']:
-            pattern_words = nltk.word_tokenize(pattern) # splits strings into words
+        for pattern in intent.get('patterns', []): # line-delimited corpora can have lines of responses only
+            pattern_words = normalisation.tokenise(pattern) # splits strings into words
             words.extend(pattern_words)
             docs.append((pattern_words, intent['tag']))
-            if intent['tag'] not in word_classes:
-                word_classes.append(intent['tag'])
-    save_data(words, word_classes, docs, corpus_file)
+            word_classes[intent['tag']] = None
+    tag_responses = response_table.corpus_responses(corpus)
+    return words, list(word_classes), docs, tag_responses
     
-def save_data(words_lst, word_classes_lst, docs, corpus_file):
+def save_data(words_lst, word_classes_lst, docs, tag_responses, corpus_file):
     '''
     Saves the pattern words and classes from the corpus as alphabetical sets
     File format .pkl, to preserve the nature of the data (sets)
+    Saves the compiled response table alongside, so responses.py never needs the corpus JSON
+    '''
+
+    corpus_name = topic_name(corpus_file)
+    words, word_classes = build_vocabulary(words_lst, word_classes_lst)
+    save_vocabulary(corpus_name, words, word_classes, tag_responses)
+    return create_training_data(words, word_classes, docs, corpus_name)
+
+def save_vocabulary(corpus_name, words, word_classes, tag_responses):
+    '''
+    Saves the vocabulary, classes and compiled response table of a topic
+    '''
+
+    check_responses(corpus_name, word_classes, tag_responses)
+    normalisation.save_words(words, f'models/{corpus_name}_words.pkl')
+    pickle.dump(word_classes, open(f'models/{corpus_name}_classes.pkl', 'wb'))
+    table = response_table.compile_response_table(tag_responses, word_classes)
+    response_table.save_response_table(table, f'models/{corpus_name}_responses.json')
+
+def check_responses(corpus_name, word_classes, tag_responses):
+    '''
+    Raises if a class has no response pool, e.g. a line-delimited corpus that never gives a tag's responses
+    '''
+
+    missing = [tag for tag in word_classes if tag not in tag_responses]
+    if missing:
+        raise ValueError(f'{corpus_name}: no responses for {", ".join(missing)}')
+
+def build_vocabulary(words_lst, word_classes_lst):
+    '''
+    Normalises the pattern words and returns the alphabetical vocabulary and class sets
     '''
 
-    corpus_name = str(corpus_file).strip('.json')
-    words = [lemmatiser.lemmatize(str(word).lower()) for word in words_lst if word not in ignore_chrs] # ignores punctuation
+    words = normaliser.normalise_all([word for word in words_lst if word not in ignore_chrs]) # ignores punctuation
     words = sorted(set(words))
     word_classes = sorted(set(word_classes_lst))
-    pickle.dump(words, open(f'models/{corpus_name}_words.pkl', 'wb'))
-    pickle.dump(word_classes, open(f'models/{corpus_name}_classes.pkl', 'wb'))
-    create_training_data(words, word_classes, docs, corpus_name)
+    return words, word_classes
+
+def topic_name(corpus_file):
+    '''
+    Gets the topic name from a corpus file name, e.g. school.json -> school
+    '''
+
+    return os.path.splitext(os.path.basename(corpus_file))[0]
     
+# ---------------------------------------------------------------------------------------------------------------------
+# Streaming Data Functions
+
+def stream_corpus_data(corpus_file):
+    '''
+    get_corpus_data() for line-delimited corpora, in memory bounded by the vocabulary and chunk size instead of the corpus
+    - pass 1 builds the vocabulary, classes and response pools a chunk of lines at a time
+    - pass 2 encodes every pattern once into word index rows in a temporary directory in models/
+    - the model then trains on batches read from those rows by batch_generator()
+    '''
+
+    corpus_name = topic_name(corpus_file)
+    corpus_path = f'{current_path}/corpora/{corpus_file}'
+    vocabulary, word_classes, tag_responses = stream_vocabulary(corpus_path)
+    words = sorted(vocabulary)
+    word_classes = sorted(word_classes)
+    save_vocabulary(corpus_name, words, word_classes, tag_responses)
+
+    word_index = {word: i for i, word in enumerate(words)}
+    class_index = {word_class: i for i, word_class in enumerate(word_classes)}
+    with tempfile.TemporaryDirectory(prefix=f'.{corpus_name}_rows_', dir=f'{current_path}/models') as directory:
+        row_count = encode_corpus(corpus_path, word_index, class_index, directory)
+        batch_size = HYPERPARAMETERS['batch_size']
+        batches = batch_generator(directory, row_count, len(words), len(word_classes), batch_size)
+        return create_streamed_model(batches, -(-row_count // batch_size), len(words), len(word_classes), corpus_name)
+
+def stream_vocabulary(corpus_path):
+    '''
+    Pass 1 of a streamed corpus, returns the vocabulary set, the classes and the response pool of each class
+    '''
+
+    vocabulary = set()
+    word_classes = {}
+    tag_responses = {}
+    for intents in corpus_stream.chunked(corpus_stream.read_intents(corpus_path), CHUNK_LINES):
+        pattern_words = []
+        for intent in intents:
+            if intent.get('patterns'): # as in corpus_documents(), a tag without patterns is not a class
+                word_classes[intent['tag']] = None
+            if 'responses' in intent:
+                tag_responses[intent['tag']] = intent['responses'] # last given wins, as in response_table.corpus_responses()
+            for pattern in intent.get('patterns', []):
+                pattern_words.extend(word for word in normalisation.tokenise(pattern) if word not in ignore_chrs) # ignores punctuation
+        vocabulary.update(normaliser.normalise_all(pattern_words))
+    return vocabulary, list(word_classes), tag_responses
+
+def encode_corpus(corpus_path, word_index, class_index, directory):
+    '''
+    Pass 2 of a streamed corpus, writes every pattern as a row of vocabulary indices, the same words create_training_matrices() marks
+    - {directory}/words.bin: int32 word indices of every row, one after the other
+    - {directory}/ends.bin: int64 end position of each row in words.bin
+    - {directory}/classes.bin: int32 class index of each row
+    Returns the number of rows
+    '''
+
+    row_count = 0
+    end = 0
+    with open(f'{directory}/words.bin', 'wb') as words_file, open(f'{directory}/ends.bin', 'wb') as ends_file, open(f'{directory}/classes.bin', 'wb') as classes_file:
+        for patterns in corpus_stream.chunked(corpus_stream.read_patterns(corpus_path), CHUNK_LINES):
+            row_words = []
+            row_ends = []
+            for pattern, tag in patterns:
+                indices = sorted({word_index[word] for word in normaliser.normalise_all(normalisation.tokenise(pattern)) if word in word_index})
+                row_words.extend(indices)
+                end += len(indices)
+                row_ends.append(end)
+            words_file.write(numpy.array(row_words, dtype=numpy.int32).tobytes())
+            ends_file.write(numpy.array(row_ends, dtype=numpy.int64).tobytes())
+            classes_file.write(numpy.array([class_index[tag] for pattern, tag in patterns], dtype=numpy.int32).tobytes())
+            row_count += len(patterns)
+    return row_count
+
+def read_rows_file(path, dtype):
+    '''
+    Memory maps an encoded rows file, numpy cannot map an empty file
+    '''
+
+    if not os.path.getsize(path):
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.memmap(path, dtype=dtype, mode='r')
+
+def batch_generator(directory, row_count, input_size, class_count, batch_size):
+    '''
+    Endless generator of (inputs, one-hot outputs) batches from the rows written by encode_corpus(), as model.fit() expects
+    - each epoch shuffles the order of blocks of SHUFFLE_BLOCK rows and the rows within each block,
+      so only one block of row numbers is held at a time rather than a permutation of the whole corpus
+    - batches are uint8 / float32 matrices like create_training_matrices() builds, one batch in memory at a time
+    '''
+
+    words = read_rows_file(f'{directory}/words.bin', numpy.int32)
+    ends = read_rows_file(f'{directory}/ends.bin', numpy.int64)
+    classes = read_rows_file(f'{directory}/classes.bin', numpy.int32)
+
+    def epoch_rows():
+        for block in numpy.random.permutation(-(-row_count // SHUFFLE_BLOCK)):
+            block_start = block * SHUFFLE_BLOCK
+            yield from block_start + numpy.random.permutation(min(SHUFFLE_BLOCK, row_count - block_start))
+
+    while True:
+        for rows in corpus_stream.chunked(epoch_rows(), batch_size):
+            inputs = numpy.zeros((len(rows), input_size), dtype=numpy.uint8)
+            outputs = numpy.zeros((len(rows), class_count), dtype=numpy.float32)
+            for i, row in enumerate(rows):
+                inputs[i, words[ends[row - 1] if row else 0:ends[row]]] = 1
+            outputs[numpy.arange(len(rows)), classes[rows]] = 1
+            yield inputs, outputs
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Unified Model Functions
+
+def create_unified_model(corpus_files):
+    '''
+    Trains a single topic-conditioned model covering every given corpus
+    - one shared vocabulary, each input row is the bag of words followed by a one-hot topic indicator
+    - the output layer holds the classes of every topic side by side, responses.py only reads the selected topic's block
+    Saves unified_words.pkl, unified_classes.pkl ({topic: classes}) and unified_responses.json ({topic: response table})
+    Line-delimited corpora are read whole here, only single topic training streams them
+    Returns the final training accuracy
+    '''
+
+    corpus_data = {topic_name(corpus_file): read_corpus(corpus_file) for corpus_file in sorted(corpus_files)}
+    topics = sorted(corpus_data)
+
+    # shared vocabulary and per topic classes, in the same formats as the single topic models
+    all_words = [word for topic in topics for word in corpus_data[topic][0] if word not in ignore_chrs] # ignores punctuation
+    words = sorted(set(normaliser.normalise_all(all_words)))
+    topic_classes = {topic: sorted(set(corpus_data[topic][1])) for topic in topics}
+    for topic in topics:
+        check_responses(topic, topic_classes[topic], corpus_data[topic][3])
+    tables = {topic: response_table.compile_response_table(corpus_data[topic][3], topic_classes[topic]) for topic in topics}
+    normalisation.save_words(words, f'models/{UNIFIED_NAME}_words.pkl')
+    pickle.dump(topic_classes, open(f'models/{UNIFIED_NAME}_classes.pkl', 'wb'))
+    response_table.save_response_table(tables, f'models/{UNIFIED_NAME}_responses.json')
+
+    # each topic's rows use the shared word columns, its own topic column and its own block of output columns
+    word_index = {word: i for i, word in enumerate(words)}
+    class_count = sum(len(word_classes) for word_classes in topic_classes.values())
+    input_blocks = []
+    output_blocks = []
+    class_offset = 0
+    for topic_position, topic in enumerate(topics):
+        docs = corpus_data[topic][2]
+        class_index = {word_class: i for i, word_class in enumerate(topic_classes[topic])}
+        word_rows, class_rows = create_training_matrices(word_index, class_index, docs)
+
+        topic_columns = numpy.zeros((len(docs), len(topics)), dtype=numpy.uint8)
+        topic_columns[:, topic_position] = 1
+        output_rows = numpy.zeros((len(docs), class_count), dtype=numpy.float32)
+        output_rows[:, class_offset:class_offset + len(class_index)] = class_rows
+        class_offset += len(class_index)
+
+        input_blocks.append(numpy.concatenate([word_rows, topic_columns], axis=1))
+        output_blocks.append(output_rows)
+    return create_model(numpy.concatenate(input_blocks), numpy.concatenate(output_blocks), UNIFIED_NAME)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Parallel Training Functions
+
+@contextlib.contextmanager
+def thread_limits(threads):
+    '''
+    Limits the TensorFlow and BLAS thread pools of training processes spawned inside the block,
+    so parallel workers do not oversubscribe the cores
+    - the environment is set before the workers are spawned, as the spawn bootstrap imports numpy
+      (and its BLAS thread pool) through this module before a pool initializer would run
+    - restored afterwards, this process imported numpy long before so the limits would not apply to it anyway
+    '''
+
+    saved = {variable: os.environ.get(variable) for variable in THREAD_VARIABLES}
+    os.environ.update({variable: str(threads) for variable in THREAD_VARIABLES})
+    try:
+        yield
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+def run_training(train_function, arguments, workers, threads=None):
+    '''
+    Calls a training function with each argument, returns the results in the order they finish
+    - in this process if there is one worker and no thread limit was asked for
+    - otherwise in spawned worker processes (TensorFlow is not fork safe), limited to threads each,
+      by default an equal share of the cores
+    '''
+
+    if workers == 1 and threads is None:
+        return [train_function(argument) for argument in arguments]
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with thread_limits(threads), ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = [executor.submit(train_function, argument) for argument in arguments]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return results
+
+def train_corpus(corpus_file):
+    '''
+    Trains one corpus with its output redirected to an isolated log file logs/training/{topic}.log
+    Returns a summary dictionary of the topic, wall time, final accuracy and log path
+    '''
+
+    return logged_training(topic_name(corpus_file), get_corpus_data, corpus_file)
+
+def train_unified(corpus_files):
+    '''
+    Trains the unified model with its output redirected to logs/training/unified.log
+    '''
+
+    return logged_training(UNIFIED_NAME, create_unified_model, corpus_files)
+
+@contextlib.contextmanager
+def redirect_output(log_path):
+    '''
+    Redirects stdout and stderr to a log file at the file descriptor level, restoring them afterwards
+    - logging handlers that keep the sys.stderr they were created with (keras, absl) and TensorFlow's native logs
+      write to the log too, then to the real streams again afterwards rather than to a closed log file
+    '''
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = [os.dup(1), os.dup(2)]
+    with open(log_path, 'w') as log:
+        try:
+            os.dup2(log.fileno(), 1)
+            os.dup2(log.fileno(), 2)
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, saved_fd in zip((1, 2), saved_fds):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+
+def logged_training(corpus_name, train_function, corpus_argument):
+    '''
+    Runs a training function with stdout and stderr redirected to logs/training/{corpus_name}.log
+    Returns a summary dictionary of the topic, wall time, final accuracy, log path and the lemmas normalised,
+    the lemma cache is saved once by the parent process with save_lemmas() rather than by every worker
+    '''
+
+    os.makedirs(f'{current_path}/logs/training', exist_ok=True)
+    log_path = f'{current_path}/logs/training/{corpus_name}.log'
+    start_time = time.perf_counter()
+
+    remove_artifacts(corpus_name)
+    with redirect_output(log_path):
+        accuracy = train_function(corpus_argument)
+        bundle.convert_model(corpus_name, normalisation.TOKENISER)
+        stats = normaliser.stats()
+        print(f"lemma cache: {stats['size']} tokens, {stats['hits']} hits, {stats['misses']} misses, {stats['hit_rate']:.1%} hit rate")
+
+    return {'topic': corpus_name, 'seconds': time.perf_counter() - start_time, 'accuracy': accuracy, 'log': log_path, 'lemmas': normaliser.new_entries()}
+
+def save_lemmas(results):
+    '''
+    Merges the lemmas normalised by every training run into the lemma cache and saves it for the next run
+    '''
+
+    if not results:
+        return
+    for result in results:
+        normaliser.update(result.pop('lemmas'))
+    normaliser.save()
+
+def print_summary(results, wall_time):
+    '''
+    Outputs a table of wall time and final accuracy per topic
+    '''
+
+    print(f"{'topic':<12} {'seconds':>9} {'accuracy':>9}  log")
+    for result in sorted(results, key=lambda x: x['topic']):
+        print(f"{result['topic']:<12} {result['seconds']:>9.1f} {result['accuracy']:>9.2%}  {result['log']}")
+    print(f"{len(results)} topics trained in {wall_time:.1f}s")
+
+# ---------------------------------------------------------------------------------------------------------------------
+# Build Manifest Functions
+
+def corpus_hash(corpus_file):
+    '''
+    Content hash of a corpus file together with the training hyperparameters and tokeniser
+    - a corpus only needs retraining when this changes
+    '''
+
+    sha = hashlib.sha256()
+    corpus_path = f'{current_path}/corpora/{corpus_file}'
+    for path in corpus_stream.corpus_paths(corpus_path):
+        if path != corpus_path: # renaming or reordering shards changes the corpus
+            sha.update(os.path.relpath(path, corpus_path).encode('utf-8'))
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(HASH_BLOCK), b''): # streamed, a corpus may not fit in memory
+                sha.update(block)
+    sha.update(json.dumps(HYPERPARAMETERS, sort_keys=True).encode('utf-8'))
+    if normalisation.TOKENISER != 'nltk': # keeps the hashes of builds made before the tokeniser could be chosen
+        sha.update(normalisation.TOKENISER.encode('utf-8'))
+    return sha.hexdigest()
+
+def load_manifest():
+    '''
+    Loads models/manifest.json, an empty manifest if there has been no build yet
+    '''
+
+    if not os.path.exists(MANIFEST_PATH):
+        return {'topics': {}}
+    with open(MANIFEST_PATH) as file:
+        return json.load(file)
+
+def save_manifest(manifest):
+    with open(MANIFEST_PATH, 'w') as file:
+        json.dump(manifest, file, indent=4, sort_keys=True)
+
+def artifacts_exist(corpus_name):
+    return all(os.path.exists(f'{current_path}/models/{corpus_name}{suffix}') for suffix in ARTIFACT_SUFFIXES)
+
+def remove_artifacts(corpus_name):
+    '''
+    Deletes a topic's artifacts before they are rebuilt
+    - they may be hard links shared with another topic, which must not be overwritten in place
+    '''
+
+    for suffix in ARTIFACT_SUFFIXES:
+        path = f'{current_path}/models/{corpus_name}{suffix}'
+        if os.path.exists(path):
+            os.remove(path)
+
+def share_artifacts(source_name, corpus_name):
+    '''
+    Makes a topic use the artifacts of an identical corpus - hard linked so they share disk space, copied if linking fails
+    '''
+
+    remove_artifacts(corpus_name)
+    for suffix in ARTIFACT_SUFFIXES:
+        source = f'{current_path}/models/{source_name}{suffix}'
+        target = f'{current_path}/models/{corpus_name}{suffix}'
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+def compress_bundles(manifest, topic_names, precision, sparsity):
+    '''
+    Rewrites the bundles of topics whose recorded compression differs from the requested one, without retraining
+    - precision and sparsity of None leave every bundle as it is
+    '''
+
+    if precision is None and sparsity is None:
+        return
+    settings = {'precision': precision or 'float32', 'sparsity': sparsity or 0.0}
+    for name in topic_names:
+        entry = manifest['topics'][name]
+        if entry.get('compression', UNCOMPRESSED) != settings:
+            bundle.convert_model(name, precision=settings['precision'], sparsity=settings['sparsity'])
+            entry['compression'] = settings
+            print(f"{name}: bundle compressed to {settings['precision']}, {settings['sparsity']:.0%} pruned")
+
+def remove_deleted_topics(manifest, corpus_files):
+    '''
+    Deletes the artifacts and manifest entries of topics whose corpus is no longer in corpora/
+    - the unified model has no corpus of its own and is kept
+    '''
+
+    for name in sorted(manifest['topics']):
+        if name != UNIFIED_NAME and name not in corpus_files:
+            remove_artifacts(name)
+            del manifest['topics'][name]
+            print(f'{name}: corpus deleted, artifacts removed')
+
+def plan_build(manifest, selected_corpora, force):
+    '''
+    Decides what to do with each selected corpus, after removing the topics of deleted corpora from the manifest
+    Returns (corpora to train, {corpus: corpus whose artifacts it shares}, corpora already up to date, {corpus: hash})
+    '''
+
+    corpus_files = {topic_name(corpus_file): corpus_file for corpus_file in corpora}
+    remove_deleted_topics(manifest, corpus_files)
+    hashes = {corpus_file: corpus_hash(corpus_file) for corpus_file in selected_corpora}
+    topic_hashes = {topic_name(corpus_file): corpus_hash_value for corpus_file, corpus_hash_value in hashes.items()}
+
+    # existing artifacts that can be shared, excluding any about to be rebuilt
+    built = {} # hash -> corpus file of a topic with up to date artifacts for it
+    for name, entry in manifest['topics'].items():
+        rebuilding = name in topic_hashes and (force or topic_hashes[name] != entry['hash'])
+        if name in corpus_files and artifacts_exist(name) and not rebuilding:
+            built.setdefault(entry['hash'], corpus_files[name])
+
+    to_train = []
+    to_share = {}
+    up_to_date = []
+    building = {} # hash -> corpus trained in this build
+    for corpus_file in selected_corpora:
+        corpus_name = topic_name(corpus_file)
+        entry = manifest['topics'].get(corpus_name)
+        corpus_hash_value = hashes[corpus_file]
+        if not force and entry and entry['hash'] == corpus_hash_value and artifacts_exist(corpus_name):
+            up_to_date.append(corpus_file)
+        elif corpus_hash_value in building:
+            to_share[corpus_file] = building[corpus_hash_value]
+        elif not force and corpus_hash_value in built:
+            to_share[corpus_file] = built[corpus_hash_value]
+        else:
+            to_train.append(corpus_file)
+            building[corpus_hash_value] = corpus_file
+    return to_train, to_share, up_to_date, hashes
+
 # ---------------------------------------------------------------------------------------------------------------------
 # Main Function
 
-def training_main():
+def training_main(argv=None):
+    '''
+    Main function of the training file, trains each JSON corpus in the corpora directory that has changed
+    - corpora are trained concurrently in a pool of worker processes, each with a limited number of threads
+    - unchanged corpora are skipped, identical corpora share one set of artifacts
+    '''
+
+    cpu_count = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Train a model for every changed corpus in corpora/')
+    parser.add_argument('--force', action='store_true', help='retrain even if the corpus is unchanged')
+    parser.add_argument('--only', action='append', metavar='TOPIC', help='only build this topic, can be repeated')
+    parser.add_argument('--workers', type=int, help='corpora trained at once, defaults to min(cores, corpora to train)')
+    parser.add_argument('--threads', type=int, help='TensorFlow/BLAS threads per worker, defaults to cores / workers, a single worker without it trains in this process')
+    parser.add_argument('--unified', action='store_true', help='train one shared model for all selected topics instead')
+    parser.add_argument('--precision', choices=compression.PRECISIONS, help='weight precision of the served bundles, see compression.py')
+    parser.add_argument('--sparsity', type=float, help='fraction of hidden units pruned from the served bundles')
+    parser.add_argument('--tokeniser', choices=sorted(normalisation.TOKENISERS), help='tokeniser to train with, recorded per model in the manifest')
+    args = parser.parse_args(argv)
+    if args.tokeniser:
+        normalisation.set_tokeniser(args.tokeniser) # before any worker is spawned, they read it from the environment
+
+    topics = [topic_name(corpus_file) for corpus_file in corpora]
+    unknown = sorted(set(args.only or []) - set(topics))
+    if unknown: # a misspelt topic would otherwise build nothing, or everything else, without saying so
+        parser.error(f"unknown topic {', '.join(unknown)}, valid topics are {', '.join(topics)}")
+    selected_corpora = [corpus_file for corpus_file in corpora if not args.only or topic_name(corpus_file) in args.only]
+    manifest = load_manifest()
+    if args.unified:
+        results = unified_main(manifest, selected_corpora, args.force, args.threads)
+        compress_bundles(manifest, [UNIFIED_NAME], args.precision, args.sparsity)
+        save_manifest(manifest)
+        return results
+    to_train, to_share, up_to_date, hashes = plan_build(manifest, selected_corpora, args.force)
+    for corpus_file in up_to_date:
+        print(f'{topic_name(corpus_file)}: unchanged, skipped')
+
+    results = []
+    start_time = time.perf_counter()
+    if to_train:
+        workers = args.workers or min(cpu_count, len(to_train))
+        results = run_training(train_corpus, to_train, workers, args.threads)
+    save_lemmas(results)
+
+    # recording the build so the next run can skip these corpora
+    topic_hashes = {topic_name(corpus_file): corpus_hash_value for corpus_file, corpus_hash_value in hashes.items()}
+    for result in results:
+        manifest['topics'][result['topic']] = {'hash': topic_hashes[result['topic']], 'accuracy': result['accuracy'], 'shares': None, 'tokeniser': normalisation.TOKENISER}
+    for corpus_file, source_file in to_share.items():
+        source_name = topic_name(source_file)
+        share_artifacts(source_name, topic_name(corpus_file))
+        manifest['topics'][topic_name(corpus_file)] = dict(manifest['topics'][source_name], shares=source_name)
+        print(f'{topic_name(corpus_file)}: identical to {source_name}, sharing its artifacts')
+    compress_bundles(manifest, [topic_name(corpus_file) for corpus_file in selected_corpora], args.precision, args.sparsity)
+    save_manifest(manifest)
+
+    if results:
+        print_summary(results, time.perf_counter() - start_time)
+    return results
+
+def unified_main(manifest, selected_corpora, force, threads):
     '''
-    Main function of the training file, runs functions upon every JSON corpus in the file directory
+    Builds the unified model from the selected corpora, skipped if none of them (or the hyperparameters) changed
     '''
 
-    for i in range(len(corpora)):
-        get_corpus_data(corpora[i])
+    # topic names are hashed with the contents, renaming a corpus changes the unified model's {topic: classes} keys
+    unified_hash = hashlib.sha256('\n'.join(sorted(f'{topic_name(corpus_file)}:{corpus_hash(corpus_file)}' for corpus_file in selected_corpora)).encode('utf-8')).hexdigest()
+    entry = manifest['topics'].get(UNIFIED_NAME)
+    if not force and entry and entry['hash'] == unified_hash and artifacts_exist(UNIFIED_NAME):
+        print(f'{UNIFIED_NAME}: unchanged, skipped')
+        return []
+
+    start_time = time.perf_counter()
+    result = run_training(train_unified, [selected_corpora], 1, threads)[0]
+    save_lemmas([result])
+    manifest['topics'][UNIFIED_NAME] = {'hash': unified_hash, 'accuracy': result['accuracy'], 'shares': None, 'tokeniser': normalisation.TOKENISER, 'topics': sorted(topic_name(corpus_file) for corpus_file in selected_corpora)}
+    save_manifest(manifest)
+    print_summary([result], time.perf_counter() - start_time)
+    return [result]
 
 # ---------------------------------------------------------------------------------------------------------------------
 # Globals
 
 current_path = os.getcwd()
-corpora = [file for file in os.listdir(f'{current_path}/corpora/') if file.endswith('.json')]
-lemmatiser = WordNetLemmatizer()
+corpora = corpus_stream.list_corpora(f'{current_path}/corpora')
+UNIFIED_NAME = 'unified' # artifact prefix of the single multi-topic model
+MANIFEST_PATH = f'{current_path}/models/manifest.json'
+ARTIFACT_SUFFIXES = ['_words.pkl', '_classes.pkl', '_model.h5', '_weights.npz', '_responses.json', '.kai']
+UNCOMPRESSED = {'precision': 'float32', 'sparsity': 0.0} # bundles as written by training
+HYPERPARAMETERS = {
+    'hidden_layers': [256, 128],
+    'dropout': 0.2,
+    'learning_rate': 0.01,
+    'momentum': 0.5,
+    'epochs': 200,
+    'batch_size': 5
+}
+CHUNK_LINES = 4096 # intents or patterns tokenised at a time when streaming a corpus
+SHUFFLE_BLOCK = 65536 # rows shuffled together when streaming a corpus
+HASH_BLOCK = 1024 * 1024
+THREAD_VARIABLES = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS']
 ignore_chrs = ['?', '!', '.', ',', "'", '"', '/', '£', '$', 
                 '%', '^', '&', '*', '@', ':', ';', '#', '~', 
                 '|', '<', '>', '{', '}', '_', '-', '+', '='
@@ -142,4 +744,4 @@ ignore_chrs = ['?', '!', '.', ',', "'", '"', '/', '£', '$',
 # Runs File
 
 if __name__ == '__main__':
-    training_main()
+    training_main(sys.argv[1:])